@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ingest"))
+from spreading import DIRECTIONS, ESTIMATORS, compute_spreading
+
+N_FREQS = 46
+
+
+def synthetic_coefficients(timesteps, seed=0):
+    # T×F alpha1, alpha2, r1, r2 and energy with the ranges a buoy reports, plus a few missing bins
+    rng = np.random.default_rng(seed)
+    shape = (timesteps, N_FREQS)
+    alpha1 = rng.uniform(0, 360, shape)
+    alpha2 = (alpha1 + rng.normal(0, 15, shape)) % 360
+    r1 = rng.uniform(0.2, 0.95, shape)
+    r2 = r1 ** 2 * rng.uniform(0.6, 1.1, shape)
+    energy = rng.gamma(2.0, 0.3, shape)
+    for a in (alpha1, alpha2, r1, r2):
+        a[rng.random(shape) < 0.01] = np.nan
+    return alpha1, alpha2, r1, r2, energy
+
+
+def best_of(estimator, inputs, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compute_spreading(*inputs, estimator=estimator)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Directional estimators, timesteps per second on T×46 inputs")
+    parser.add_argument("--timesteps", type=int, default=8760, help="timesteps of synthetic coefficients (a year hourly)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = synthetic_coefficients(args.timesteps)
+
+    # every estimator has to give a normalized D before the timings mean anything
+    delta_theta = np.deg2rad(DIRECTIONS[1] - DIRECTIONS[0])
+    for name in ESTIMATORS:
+        D, _ = compute_spreading(*(a[:64] for a in inputs), estimator=name)
+        sums = np.sum(D, axis=-1) * delta_theta
+        assert np.allclose(sums[np.isfinite(sums)], 1), name
+
+    timings = {name: best_of(name, inputs, args.repeat) for name in ESTIMATORS}
+
+    print(f"timesteps: {args.timesteps}  bins: {N_FREQS}  directions: {len(DIRECTIONS)}")
+    for name, seconds in timings.items():
+        print(f"{name:8s} {seconds:.3f} s  ({args.timesteps / seconds:,.0f} timesteps/s)  "
+              f"{seconds / timings['fourier']:.1f}x fourier")
+
+
+if __name__ == "__main__":
+    main()
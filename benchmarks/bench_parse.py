@@ -0,0 +1,102 @@
+import argparse
+import io
+import os
+import sys
+import time
+import multiprocessing
+import resource
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ingest"))
+from parse import parse_spectral
+
+N_FREQS = 46
+
+
+def synthetic_file(years, seed=0):
+    # hourly .data_spec rows in the realtime2 layout (newest first), sprinkled with MM/999.0
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(end="2024-12-31 23:00", periods=years * 8760, freq="h")[::-1]
+    freqs = np.linspace(0.0325, 0.485, N_FREQS)
+    values = np.round(rng.gamma(2.0, 0.3, (len(times), N_FREQS)), 3).astype(str)
+    values[rng.random(values.shape) < 0.01] = "999.0"
+    values[rng.random(values.shape) < 0.005] = "MM"
+
+    lines = ["#YY  MM DD hh mm Sep_Freq  < spec_1 (freq_1) spec_2 (freq_2) spec_3 (freq_3) ... >"]
+    freq_tokens = [f"({f:.3f})" for f in freqs]
+    for t, row in zip(times, values):
+        pairs = " ".join(f"{v} {f}" for v, f in zip(row, freq_tokens))
+        lines.append(f"{t:%Y %m %d %H %M} 9.999 {pairs}")
+    return "\n".join(lines) + "\n"
+
+
+def read_csv_path(text):
+    # the DataFrame path get_buoy_data used before parse_spectral
+    df = pd.read_csv(io.StringIO(text), sep=r"\s+", skiprows=[0], na_values=["MM", "999.0"], header=None)
+    df.rename(columns=dict(zip(df.columns[0:5], ["year", "month", "day", "hour", "minute"])), inplace=True)
+    df.insert(0, "datetime", pd.to_datetime(df[["year", "month", "day", "hour", "minute"]], utc=True))
+    df.drop(["year", "month", "day", "hour", "minute"], axis="columns", inplace=True)
+    df.drop(range(7, 98, 2), axis="columns", inplace=True)
+    return df.set_axis(["datetime", "sep_freq"] + list(range(1, N_FREQS + 1)), axis=1)
+
+
+def best_of(fn, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def rss_child(fn, text, queue):
+    # ru_maxrss is a high-water mark in KB on Linux, the child starts from the parent's footprint
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    fn(text)
+    queue.put((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024)
+
+
+def peak_memory(fn, text):
+    # run in a forked child so allocations made inside the pandas C parser are counted too
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=rss_child, args=(fn, text, queue))
+    proc.start()
+    peak = queue.get()
+    proc.join()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parse_spectral vs the read_csv path on a large .data_spec file")
+    parser.add_argument("--file", help="realtime2-layout .data_spec file (defaults to a synthetic one)")
+    parser.add_argument("--years", type=int, default=3, help="years of hourly rows for the synthetic file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file) as f:
+            text = f.read()
+    else:
+        text = synthetic_file(args.years)
+    rows = text.count("\n") - 1
+
+    # both paths have to agree before the timings mean anything
+    block = parse_spectral(text)
+    df = read_csv_path(text)
+    assert np.allclose(block.values, df.iloc[:, 2:].to_numpy(float), equal_nan=True, atol=1e-3)
+
+    t_csv = best_of(read_csv_path, text, args.repeat)
+    t_fast = best_of(parse_spectral, text, args.repeat)
+    m_csv = peak_memory(read_csv_path, text)
+    m_fast = peak_memory(parse_spectral, text)
+
+    print(f"rows: {rows}  size: {len(text) / 1e6:.1f} MB")
+    print(f"read_csv path:  {t_csv:.3f} s  ({rows / t_csv:,.0f} rows/s)  peak +{m_csv / 1e6:.0f} MB")
+    print(f"parse_spectral: {t_fast:.3f} s  ({rows / t_fast:,.0f} rows/s)  peak +{m_fast / 1e6:.0f} MB")
+    print(f"speedup: {t_csv / t_fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
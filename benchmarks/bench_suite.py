@@ -0,0 +1,525 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extensions import parse_dsn
+from sqlalchemy.engine import URL
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "ingest"))
+sys.path.insert(0, os.path.join(HERE, "..", "wave_viewer"))
+
+import pull_buoy_data
+from bulk_load import BATCH_SIZE
+from fetch import FILE_EXTS, fetch_stations
+from parse import parse_spectral
+from schema import migrate
+from spreading import ESTIMATORS, compute_spreading
+
+# realtime2 files kept in the repo, one set per station (46026.txt, 46026.data_spec, ...)
+FIXTURES_DIR = os.path.join(HERE, "fixtures")
+
+# where results go by default, one file per commit
+RESULTS_DIR = os.path.join(HERE, "results")
+
+# server the throwaway database is created on, the suite never writes to the database it connects to
+ADMIN_DSN = os.environ.get("DIRSPEC_BENCH_DSN", "dbname=postgres user=Jacob host=localhost port=5432")
+
+# header lines of the realtime2 files, as NDBC writes them
+TXT_HEADER = ("#YY  MM DD hh mm WDIR WSPD GST  WVHT   DPD   APD MWD   PRES  ATMP  WTMP  DEWP  VIS PTDY  TIDE\n"
+              "#yr  mo dy hr mn degT m/s  m/s     m   sec   sec degT   hPa  degC  degC  degC  nmi  hPa    ft\n")
+SPEC_HEADERS = {
+    "data_spec": "#YY  MM DD hh mm Sep_Freq  < spec_1 (freq_1) spec_2 (freq_2) spec_3 (freq_3) ... >\n",
+    "swdir": "#YY  MM DD hh mm alpha1_1 (freq_1) alpha1_2 (freq_2) alpha1_3 (freq_3) ... >\n",
+    "swdir2": "#YY  MM DD hh mm alpha2_1 (freq_1) alpha2_2 (freq_2) alpha2_3 (freq_3) ... >\n",
+    "swr1": "#YY  MM DD hh mm r1_1 (freq_1) r1_2 (freq_2) r1_3 (freq_3) ... >\n",
+    "swr2": "#YY  MM DD hh mm r2_1 (freq_1) r2_2 (freq_2) r2_3 (freq_3) ... >\n",
+}
+SPEC_FORMATS = {"data_spec": "%.3f", "swdir": "%.1f", "swdir2": "%.1f", "swr1": "%.3f", "swr2": "%.3f"}
+
+# tables process_station writes to, counted before and after to get rows per second
+WRITTEN_TABLES = ["time_steps", "spectra_parameters", "spectra_directional_packed", "spectral_stats"]
+
+
+# --- data ------------------------------------------------------------------------------------
+
+def synthetic_station(station_id, timesteps, seed=0, end="2024-12-31 23:30"):
+    # {ext: text} for one station in the realtime2 layout (newest first, half-hourly, WPM bins),
+    # with coefficients in the ranges a buoy reports and about 1% of bins missing (999.0)
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(end=end, periods=timesteps, freq="30min")[::-1]
+    dates = np.array([f"{t:%Y %m %d %H %M}" for t in times])
+    F = len(pull_buoy_data.freqs)
+    shape = (timesteps, F)
+
+    alpha1 = rng.uniform(0, 360, shape)
+    r1 = rng.uniform(0.2, 0.95, shape)
+    values = {
+        "data_spec": rng.gamma(2.0, 0.3, shape),
+        "swdir": alpha1,
+        "swdir2": (alpha1 + rng.normal(0, 15, shape)) % 360,
+        "swr1": r1,
+        "swr2": r1 ** 2 * rng.uniform(0.6, 1.1, shape),
+    }
+    missing = rng.random(shape) < 0.01
+    freq_tokens = np.array([f"({f:.3f})" for f in pull_buoy_data.freqs])
+
+    files = {}
+    for ext, v in values.items():
+        tokens = np.char.mod(SPEC_FORMATS[ext], v)
+        tokens[missing] = "999.0"
+        tokens = np.char.add(np.char.add(tokens, " "), freq_tokens)
+        prefix = np.char.add(dates, " 9.999 " if ext == "data_spec" else " ")
+        lines = [p + " ".join(row) for p, row in zip(prefix, tokens)]
+        files[ext] = SPEC_HEADERS[ext] + "\n".join(lines) + "\n"
+
+    wvht = 4 * np.sqrt(np.nansum(values["data_spec"] * 0.01, axis=1))
+    txt = [f"{d} {int(w):3d} {s:4.1f} {s * 1.3:4.1f} {h:5.2f} {p:4.0f} {p * 0.7:5.1f} {int(w):3d} "
+           f"{pr:6.1f} {a:5.1f} {a - 2:5.1f} {a - 4:5.1f}   MM {t:+4.1f}    MM"
+           for d, w, s, h, p, pr, a, t in zip(dates, rng.uniform(0, 360, timesteps), rng.uniform(0, 15, timesteps),
+                                              wvht, rng.uniform(4, 16, timesteps), rng.normal(1015, 5, timesteps),
+                                              rng.normal(15, 3, timesteps), rng.normal(0, 1, timesteps))]
+    files["txt"] = TXT_HEADER + "\n".join(txt) + "\n"
+    return files
+
+
+def synthetic_stations(n_stations, timesteps, seed=0):
+    # {station_id: {ext: text}}, ids that can't collide with real NDBC stations
+    return {f"bench{i:03d}": synthetic_station(f"bench{i:03d}", timesteps, seed + i) for i in range(n_stations)}
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    # {station_id: {ext: text}} for every station with all six files in the directory
+    stations = {}
+    for name in sorted(os.listdir(directory)):
+        station_id, _, ext = name.partition(".")
+        if ext in FILE_EXTS:
+            with open(os.path.join(directory, name)) as f:
+                stations.setdefault(station_id, {})[ext] = f.read()
+    return {s: files for s, files in stations.items() if all(ext in files for ext in FILE_EXTS)}
+
+
+def record_fixtures(stations, rows, directory=FIXTURES_DIR):
+    # replaces the fixtures with the newest rows of the live realtime2 files
+    os.makedirs(directory, exist_ok=True)
+    for station_id, files, _ in fetch_stations(stations):
+        if any(files.get(ext) is None for ext in FILE_EXTS):
+            print(f"Skipping {station_id}: not every realtime2 file is published")
+            continue
+        for ext, text in files.items():
+            header_lines = 2 if ext == "txt" else 1
+            lines = text.splitlines(keepends=True)
+            with open(os.path.join(directory, f"{station_id}.{ext}"), "w") as f:
+                f.writelines(lines[:header_lines + rows])
+        print(f"Recorded {station_id}, {rows} rows per file")
+
+
+def parse_station(station_id, files):
+    # the same parse pull_buoy_data.get_buoy_data runs: (df_txt, {ext: SpectralBlock})
+    df_txt = pull_buoy_data.datetime_dfs(pull_buoy_data.read_ndbc(files["txt"], skiprows=[1]), station_id)
+    return df_txt, {ext: parse_spectral(files[ext]) for ext in pull_buoy_data.SPEC_EXTS}
+
+
+# --- timing ----------------------------------------------------------------------------------
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def latency(fn, repeat, reset=None):
+    # {"p50_ms", "p95_ms", "mean_ms", "n"} over repeat calls, reset (if given) runs untimed before each
+    times = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    p50, p95 = np.percentile(times, [50, 95])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "mean_ms": round(float(np.mean(times)), 3), "n": len(times)}
+
+
+# --- benchmarks ------------------------------------------------------------------------------
+
+def bench_parse(stations, repeat):
+    rows = sum(text.count("\n") - (2 if ext == "txt" else 1) for files in stations.values() for ext, text in files.items())
+    size = sum(len(text) for files in stations.values() for text in files.values())
+    seconds = best_of(lambda: [parse_station(s, files) for s, files in stations.items()], repeat)
+    return {"stations": len(stations), "rows": rows, "mb": round(size / 1e6, 3), "seconds": round(seconds, 4),
+            "rows_per_s": round(rows / seconds), "mb_per_s": round(size / 1e6 / seconds, 2)}
+
+
+def bench_spreading(parsed, repeat):
+    # every estimator over the same T×F coefficients
+    _, spec = next(iter(parsed.values()))
+    inputs = [spec[ext].values.astype(float) for ext in ("swdir", "swdir2", "swr1", "swr2", "data_spec")]
+    T = len(inputs[0])
+    results = {}
+    for name in ESTIMATORS:
+        seconds = best_of(lambda: compute_spreading(*inputs, estimator=name), repeat)
+        results[name] = {"timesteps": T, "seconds": round(seconds, 4), "timesteps_per_s": round(T / seconds),
+                         "us_per_timestep": round(seconds / T * 1e6, 2)}
+    return results
+
+
+def table_rows(conn):
+    with conn.cursor() as cur:
+        cur.execute(" UNION ALL ".join(f"SELECT count(*) FROM dirspec.{t}" for t in WRITTEN_TABLES))
+        return sum(r[0] for r in cur.fetchall())
+
+
+def bench_db_write(conn, parsed, estimator):
+    # the whole process_station path (alignment, stats, spreading, COPY and flag update) per station
+    before = table_rows(conn)
+    timesteps = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for station_id, (df_txt, spec) in parsed.items():
+            timesteps += len(pull_buoy_data.process_station(conn, station_id, df_txt, spec, BATCH_SIZE, estimator))
+    seconds = time.perf_counter() - start
+    rows = table_rows(conn) - before
+    return {"estimator": estimator, "stations": len(parsed), "timesteps": timesteps, "rows": rows,
+            "seconds": round(seconds, 3), "timesteps_per_s": round(timesteps / seconds),
+            "rows_per_s": round(rows / seconds)}
+
+
+def sample_ids(conn, n, seed=0):
+    # (station ids, time_step ids) with spectra, spread over every station
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT b.station_id, ts.id FROM dirspec.time_steps ts JOIN dirspec.buoys b ON b.id = ts.buoy_id
+            WHERE ts.spectra_ingested
+        """)
+        rows = cur.fetchall()
+    rng = np.random.default_rng(seed)
+    picked = [rows[i] for i in rng.choice(len(rows), size=min(n, len(rows)), replace=False)]
+    return sorted({s for s, _ in rows}), [int(t) for _, t in picked]
+
+
+def cycle(values):
+    # endless round robin, each timed call gets the next argument
+    state = {"i": -1}
+
+    def next_value():
+        state["i"] = (state["i"] + 1) % len(values)
+        return values[state["i"]]
+    return next_value
+
+
+def viewports():
+    # (west, south, east, north, zoom) from the whole world down to a few degrees
+    return [(-180.0, -80.0, 180.0, 80.0, 1), (-130.0, 20.0, -60.0, 55.0, 3), (-125.0, 33.0, -119.0, 39.0, 6)]
+
+
+def query_cases(station, timestep, view):
+    # {name: zero-argument call} for every query function, arguments drawn from the given providers
+    import data.query as dq
+    from components.map.map_fig import cluster_cell
+    freq = float(pull_buoy_data.freqs[10])
+
+    def clusters():
+        west, south, east, north, zoom = view()
+        return dq.get_station_clusters(west, south, east, north, cluster_cell(zoom))
+
+    return {
+        "get_buoy_locations": lambda: dq.get_buoy_locations(),
+        "get_station_clusters": clusters,
+        "get_spectrum_for_timestep": lambda: dq.get_spectrum_for_timestep(timestep()),
+        "get_param_for_timestep": lambda: dq.get_param_for_timestep(timestep()),
+        "get_station_name": lambda: dq.get_station_name(station()),
+        "get_timestamp": lambda: dq.get_timestamp(timestep()),
+        "get_ts_data": lambda: dq.get_ts_data(station()),
+        "get_timesteps_for_dd": lambda: dq.get_timesteps_for_dd(station()),
+        "get_timestep_page": lambda: dq.get_timestep_page(station()),
+        "get_station_range": lambda: dq.get_station_range(station()),
+        "get_timestep_bundle": lambda: dq.get_timestep_bundle(timestep()),
+        "get_spreading_matrix": lambda: dq.get_spreading_matrix(timestep()),
+        "get_spectral_data": lambda: dq.get_spectral_data(timestep(), freq),
+    }
+
+
+def bench_queries(stations, timestep_ids, repeat):
+    # every query function cold (cache emptied before each call, a new argument each time) and
+    # warm (the same argument every time, so served from the cache)
+    from data import cache
+    cold = query_cases(cycle(stations), cycle(timestep_ids), cycle(viewports()))
+    warm = query_cases(lambda: stations[0], lambda: timestep_ids[0], lambda: viewports()[1])
+
+    # first call opens the pool and the cache listener, kept out of the timings
+    warm["get_buoy_locations"]()
+
+    results = {}
+    for name in cold:
+        results[name] = {"cold": latency(cold[name], repeat, reset=cache.invalidate)}
+        warm[name]()
+        results[name]["warm"] = latency(warm[name], repeat)
+    return results
+
+
+def dash_request(app, name, values):
+    # /_dash-update-component body for the server callback called name, values is {"id.prop": value}
+    # for the inputs and states that matter (the rest go as None), the first one is what changed
+    key, spec = next((k, v) for k, v in app.callback_map.items() if "callback" in v and v["callback"].__name__ == name)
+    outputs = [{"id": o.rsplit(".", 1)[0], "property": o.rsplit(".", 1)[1]} for o in key.strip(".").split("...")]
+
+    def props(items):
+        return [{"id": i["id"], "property": i["property"], "value": values.get(f"{i['id']}.{i['property']}")}
+                for i in items]
+    return {
+        "output": key,
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": props(spec["inputs"]),
+        "state": props(spec["state"]),
+        "changedPropIds": [next(iter(values))],
+    }
+
+
+def callback_cases(station, timestep, view, frames):
+    # (callback name, label, provider of its {"id.prop": value}), in the order the page fires them
+
+    def relayout():
+        west, south, east, north, zoom = view()
+        return {"map._derived": {"coordinates": [[west, north], [east, north], [east, south], [west, south]]},
+                "map.zoom": zoom}
+
+    cases = [
+        ("update_map_viewport", "update_map_viewport", lambda: {"buoy-map.relayoutData": relayout()}),
+        ("zoom_to_cluster", "zoom_to_cluster",
+         lambda: {"buoy-map.clickData": {"points": [{"customdata": [None, 5], "lat": 30.0, "lon": -70.0}]}}),
+        ("update_timestep_dropdown", "update_timestep_dropdown",
+         lambda: {"buoy-map.clickData": {"points": [{"customdata": [station(), 1]}]}}),
+        ("store_selected_timestep", "store_selected_timestep", lambda: {"timestep-dropdown.value": timestep()}),
+        ("update_spectrum_plot", "update_spectrum_plot",
+         lambda: {"stored-timestep.data": timestep(), "stored-buoy.data": station(), "stored-freq.data": 0.1}),
+        ("update_freq_marker", "update_freq_marker", lambda: {"stored-freq.data": 0.1}),
+    ]
+    for name in ESTIMATORS:
+        cases.append(("store_spreading", f"store_spreading[{name}]",
+                      lambda name=name: {"stored-timestep.data": timestep(), "estimator-select.value": name}))
+    # playback last, it leaves prefetches running in the background
+    cases += [
+        ("set_playback_speed", "set_playback_speed", lambda: {"playback-speed.value": 4}),
+        ("toggle_playback", "toggle_playback",
+         lambda: {"playback-toggle.n_clicks": 1, "playback-interval.disabled": True,
+                  "timestep-dropdown.options": [{"label": str(t), "value": t} for t in frames],
+                  "timestep-dropdown.value": frames[0], "estimator-select.value": "fourier"}),
+        ("advance_playback", "advance_playback",
+         lambda: {"playback-interval.n_intervals": 1, "playback-state.data": {"frames": frames, "index": 0},
+                  "estimator-select.value": "fourier"}),
+    ]
+    return cases
+
+
+def bench_callbacks(stations, timestep_ids, repeat):
+    # every server-side Dash callback through the Flask test client, so request parsing and
+    # response serialization count too. cold empties the query cache before each call
+    import dirspec
+    from data import cache
+    app = dirspec.app
+    client = app.server.test_client()
+
+    def request(name, label, values):
+        def call():
+            r = client.post("/_dash-update-component", json=dash_request(app, name, values()))
+            # 204 is a PreventUpdate, anything else is a broken benchmark
+            if r.status_code not in (200, 204):
+                raise RuntimeError(f"{label} returned {r.status_code}: {r.data[:300]!r}")
+        return call
+
+    # cold cycles through the sampled ids with the cache emptied each time, warm repeats one
+    frames = timestep_ids[:16]
+    cold = callback_cases(cycle(stations), cycle(timestep_ids), cycle(viewports()), frames)
+    warm = callback_cases(lambda: stations[0], lambda: timestep_ids[0], lambda: viewports()[1], frames)
+
+    results = {}
+    for (name, label, cold_values), (_, _, warm_values) in zip(cold, warm):
+        results[label] = {"cold": latency(request(name, label, cold_values), repeat, reset=cache.invalidate)}
+        warm_call = request(name, label, warm_values)
+        warm_call()
+        results[label]["warm"] = latency(warm_call, repeat)
+    return results
+
+
+# --- throwaway database ----------------------------------------------------------------------
+
+@contextlib.contextmanager
+def throwaway_db(admin_dsn=ADMIN_DSN, keep=False):
+    # a fresh database on the server behind admin_dsn, migrated and dropped afterwards.
+    # yields (psycopg2 connection, sqlalchemy url)
+    name = f"dirspec_bench_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE DATABASE {name}")
+    conn = psycopg2.connect(admin_dsn, dbname=name)
+    # built from the dsn itself, get_dsn_parameters leaves the password out
+    params = parse_dsn(admin_dsn)
+    url = URL.create("postgresql+psycopg2", username=params.get("user"), password=params.get("password"),
+                     host=params.get("host"), port=int(params["port"]) if params.get("port") else None, database=name,
+                     query={k: v for k, v in params.items() if k not in ("user", "password", "host", "port", "dbname")})
+    url = url.render_as_string(hide_password=False)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(conn)
+        yield conn, url
+    finally:
+        conn.close()
+        if keep:
+            print(f"Kept database {name}")
+        else:
+            with admin.cursor() as cur:
+                # the viewer's pool and cache listener may still be connected
+                cur.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = %s AND pid <> pg_backend_pid()", (name,))
+                cur.execute(f"DROP DATABASE {name}")
+        admin.close()
+
+
+def add_stations(conn, station_ids, seed=0):
+    rng = np.random.default_rng(seed)
+    with conn.cursor() as cur:
+        for station_id in station_ids:
+            cur.execute("""
+                INSERT INTO dirspec.buoys (station_id, name, lat, lon) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (station_id) DO NOTHING
+            """, (station_id, f"Benchmark {station_id}", rng.uniform(20, 50), rng.uniform(-130, -60)))
+    conn.commit()
+
+
+# --- results ---------------------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(results, prefix=""):
+    # {"queries.get_timestamp.cold.p50_ms": 1.2, ...}, just the numbers worth comparing
+    flat = {}
+    for k, v in results.items():
+        if isinstance(v, dict):
+            flat.update(flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool) and k not in ("n", "stations", "timesteps", "rows", "mb"):
+            flat[f"{prefix}{k}"] = v
+    return flat
+
+
+def compare(old, new):
+    # prints every metric present in both runs with its change, latencies and seconds are
+    # better lower, throughputs better higher
+    a, b = flatten(old["results"]), flatten(new["results"])
+    print(f"{old['commit']} -> {new['commit']}")
+    for key in sorted(a.keys() & b.keys()):
+        if not a[key]:
+            continue
+        change = (b[key] - a[key]) / a[key] * 100
+        better = change < 0 if key.endswith(("_ms", "seconds", "us_per_timestep")) else change > 0
+        flag = "" if abs(change) < 5 else ("  better" if better else "  WORSE")
+        print(f"{key:60s} {a[key]:>12} {b[key]:>12} {change:+7.1f}%{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest and viewer benchmarks against a throwaway local postgres")
+    parser.add_argument("--stations", type=int, default=4, help="synthetic stations")
+    parser.add_argument("--timesteps", type=int, default=2000, help="synthetic half-hourly timesteps per station")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per throughput measurement")
+    parser.add_argument("--samples", type=int, default=50, help="calls per query and callback latency")
+    parser.add_argument("--estimator", choices=sorted(ESTIMATORS), default="fourier", help="estimator for the db write")
+    parser.add_argument("--output", help=f"results file (default {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare this run against")
+    parser.add_argument("--keep-db", action="store_true", help="leave the benchmark database behind")
+    parser.add_argument("--record", nargs="*", metavar="STATION",
+                        help="refresh the fixtures from live NDBC realtime2 files and exit")
+    parser.add_argument("--record-rows", type=int, default=48, help="rows kept per recorded file")
+    args = parser.parse_args()
+
+    if args.record is not None:
+        record_fixtures(args.record or list(load_fixtures()), args.record_rows)
+        return
+
+    fixtures = load_fixtures()
+    synthetic = synthetic_stations(args.stations, args.timesteps)
+    results = {}
+
+    print(f"parse: {len(fixtures)} fixture stations, {args.stations} synthetic stations x {args.timesteps} timesteps")
+    results["parse"] = {"fixtures": bench_parse(fixtures, args.repeat), "synthetic": bench_parse(synthetic, args.repeat)}
+    parsed = {s: parse_station(s, files) for s, files in synthetic.items()}
+    results["spreading"] = bench_spreading(parsed, args.repeat)
+
+    with throwaway_db(keep=args.keep_db) as (conn, url):
+        # the viewer reads its connection and snapshot paths at import, so these go first
+        os.environ["DIRSPEC_DB_URL"] = url
+        os.environ["DIRSPEC_MAP_SNAPSHOT"] = os.path.join(tempfile.mkdtemp(), "map_snapshot.json")
+        os.environ.pop("DIRSPEC_CACHE_DIR", None)
+
+        add_stations(conn, list(fixtures) + list(parsed))
+        print("db write")
+        results["db_write"] = {
+            "fixtures": bench_db_write(conn, {s: parse_station(s, f) for s, f in fixtures.items()}, args.estimator),
+            "synthetic": bench_db_write(conn, parsed, args.estimator),
+        }
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        conn.commit()
+
+        stations, timestep_ids = sample_ids(conn, args.samples)
+        print(f"queries: {args.samples} calls each")
+        results["queries"] = bench_queries(stations, timestep_ids, args.samples)
+        print(f"callbacks: {args.samples} calls each")
+        results["callbacks"] = bench_callbacks(stations, timestep_ids, args.samples)
+
+        from data import prefetch
+        prefetch.get_pool().shutdown(wait=True)
+        from data.query import get_engine
+        get_engine().dispose()
+
+    run = {
+        "commit": git_commit(),
+        "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "params": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{run['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(run, f, indent=2)
+
+    for kind in ("fixtures", "synthetic"):
+        p, w = results["parse"][kind], results["db_write"][kind]
+        print(f"{kind:9s} parse {p['rows_per_s']:>10,} rows/s {p['mb_per_s']:>7} MB/s   "
+              f"write {w['rows_per_s']:>10,} rows/s {w['timesteps_per_s']:>7,} timesteps/s")
+    for name, r in results["spreading"].items():
+        print(f"spreading {name:8s} {r['us_per_timestep']:>8} us/timestep {r['timesteps_per_s']:>10,} timesteps/s")
+    for section in ("queries", "callbacks"):
+        for name, r in results[section].items():
+            print(f"{name:32s} cold p50 {r['cold']['p50_ms']:>8} p95 {r['cold']['p95_ms']:>8} ms   "
+                  f"warm p50 {r['warm']['p50_ms']:>8} p95 {r['warm']['p95_ms']:>8} ms")
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
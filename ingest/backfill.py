@@ -0,0 +1,387 @@
+import argparse
+import gzip
+import io
+import itertools
+import multiprocessing
+import os
+import re
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from bulk_load import BATCH_SIZE, DIRECTIONAL_LAYOUT
+from parse import parse_spectral, to_datetime64, SpectralBlock
+from spreading import DIRECTIONS, ESTIMATORS
+import pull_buoy_data
+
+# NDBC historical archive letter -> the realtime2 file it stands in for
+# (46026h2019.txt.gz is stdmet, 46026w2019.txt.gz spectral density, d/i/j/k are alpha1/alpha2/r1/r2)
+ARCHIVE_KINDS = {'h': 'txt', 'w': 'data_spec', 'd': 'swdir', 'i': 'swdir2', 'j': 'swr1', 'k': 'swr2'}
+ARCHIVE_NAME = re.compile(r'^(?P<station>\w+?)(?P<kind>[hwdijk])(?P<year>\d{4})\.txt(\.gz)?$', re.IGNORECASE)
+
+# data lines read from each file per step, memory scales with this and not with the file length
+CHUNK_ROWS = 1000
+
+# older stdmet files use different names for the same columns
+STDMET_NAMES = {'WD': 'WDIR', 'BAR': 'PRES', 'YYYY': 'YY', 'YEAR': 'YY'}
+
+# historical stdmet files mark missing values with a run of 9s rather than MM
+STDMET_MISSING = {
+    'WDIR': [999], 'WSPD': [99.0], 'GST': [99.0], 'WVHT': [99.0], 'DPD': [99.0], 'APD': [99.0],
+    'MWD': [999], 'PRES': [9999.0], 'ATMP': [999.0], 'WTMP': [999.0], 'DEWP': [999.0],
+    'VIS': [99.0], 'PTDY': [99.0], 'TIDE': [99.0],
+}
+
+
+def find_archives(directory, stations=None):
+    # {(station_id, year): {ext: path}} for every archive file in the directory
+    units = defaultdict(dict)
+    for name in sorted(os.listdir(directory)):
+        match = ARCHIVE_NAME.match(name)
+        if match is None:
+            continue
+        station_id = match['station'].lower()
+        if stations and station_id not in stations:
+            continue
+        units[(station_id, int(match['year']))][ARCHIVE_KINDS[match['kind'].lower()]] = os.path.join(directory, name)
+    return dict(units)
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', errors='replace')
+    return open(path, errors='replace')
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    # yields (header, body) with up to chunk_rows data lines per body, never holding the whole file
+    with open_text(path) as f:
+        header = []
+        for line in f:
+            if line[:1].isdigit():
+                lines = itertools.chain([line], f)
+                break
+            header.append(line)
+        else:
+            return
+        header = ''.join(header)
+        while True:
+            body = ''.join(itertools.islice(lines, chunk_rows))
+            if not body:
+                return
+            yield header, body
+
+
+def parse_stdmet(header, body, station_id):
+    # one chunk of a historical stdmet file -> DataFrame shaped like datetime_dfs output
+    names = [STDMET_NAMES.get(n, n) for n in header.splitlines()[0].lstrip('#').split()]
+    n_date = 5 if 'mm' in names[:5] else 4
+    df = pd.read_csv(io.StringIO(body), sep=r'\s+', header=None, names=names,
+                     na_values={k: v for k, v in STDMET_MISSING.items() if k in names})
+    times = to_datetime64(df.iloc[:, :n_date].to_numpy(dtype=np.int64))
+    df = df.iloc[:, n_date:]
+    df.insert(0, 'datetime', pd.DatetimeIndex(times).tz_localize('UTC'))
+    df.insert(0, 'station_id', station_id)
+    return df
+
+
+def stream(ext, path, station_id, chunk_rows=CHUNK_ROWS):
+    for header, body in read_chunks(path, chunk_rows):
+        if ext == 'txt':
+            yield parse_stdmet(header, body, station_id)
+        else:
+            yield parse_spectral(header + body)
+
+
+def times_of(piece):
+    if isinstance(piece, SpectralBlock):
+        return piece.times
+    return piece['datetime'].dt.tz_convert(None).to_numpy().astype('datetime64[m]')
+
+
+def concat(a, b):
+    if a is None:
+        return b
+    if isinstance(a, SpectralBlock):
+        sep_freq = np.concatenate([a.sep_freq, b.sep_freq]) if a.sep_freq is not None else None
+        return SpectralBlock(np.concatenate([a.times, b.times]), a.freqs,
+                             np.concatenate([a.values, b.values]), sep_freq)
+    return pd.concat([a, b], ignore_index=True)
+
+
+def split_at(piece, horizon):
+    # (rows at or before horizon, rows after it)
+    mask = times_of(piece) <= horizon
+    if isinstance(piece, SpectralBlock):
+        def take(m):
+            sep_freq = piece.sep_freq[m] if piece.sep_freq is not None else None
+            return SpectralBlock(piece.times[m], piece.freqs, piece.values[m], sep_freq)
+        return take(mask), take(~mask)
+    return piece[mask], piece[~mask].reset_index(drop=True)
+
+
+def backfill_unit(conn, station_id, paths, chunk_rows=CHUNK_ROWS, batch_size=BATCH_SIZE,
+                  estimator=pull_buoy_data.ESTIMATOR):
+    # merges the six yearly files for one station chunk by chunk and pushes every stretch of
+    # time that is complete in all of them through process_station. returns timesteps written
+    streams = {ext: stream(ext, paths[ext], station_id, chunk_rows) for ext in pull_buoy_data.FILE_EXTS}
+    buffers = dict.fromkeys(streams)
+    live = set(streams)
+    written = 0
+
+    def refill(ext):
+        # read until the buffer holds rows again or the file runs out
+        while ext in live and (buffers[ext] is None or len(times_of(buffers[ext])) == 0):
+            piece = next(streams[ext], None)
+            if piece is None:
+                live.discard(ext)
+            else:
+                buffers[ext] = concat(buffers[ext], piece)
+
+    for ext in streams:
+        refill(ext)
+
+    while any(buffers[ext] is not None and len(times_of(buffers[ext])) for ext in streams):
+        # archives run oldest first, so everything up to the last row read from the file that is
+        # furthest behind is already in every buffer it will ever be in
+        lagging = [times_of(buffers[ext])[-1] for ext in live]
+        horizon = min(lagging) if lagging else np.datetime64('9999-12-31', 'm')
+
+        ready = {}
+        for ext in streams:
+            if buffers[ext] is None:
+                # a file with no rows at all, nothing can line up with it
+                return written
+            ready[ext], buffers[ext] = split_at(buffers[ext], horizon)
+
+        spec = {ext: ready[ext] for ext in pull_buoy_data.SPEC_EXTS}
+        written += len(pull_buoy_data.process_station(conn, station_id, ready['txt'], spec, batch_size, estimator))
+
+        # once a finished file has nothing left, the rest of the others can't line up with it
+        if any(ext not in live and len(times_of(buffers[ext])) == 0 for ext in streams):
+            break
+
+        for ext in list(live):
+            refill(ext)
+    return written
+
+
+# unit status lives in dirspec.backfill_units, a rerun skips done units and retries the rest
+MARK_SQL = """
+    INSERT INTO dirspec.backfill_units (station_id, year, status, timesteps, seconds, error, attempts, updated_at)
+    VALUES (%(station_id)s, %(year)s, %(status)s, %(timesteps)s, %(seconds)s, %(error)s,
+            CASE WHEN %(status)s = 'running' THEN 1 ELSE 0 END, now())
+    ON CONFLICT (station_id, year) DO UPDATE
+    SET status = EXCLUDED.status,
+        timesteps = COALESCE(EXCLUDED.timesteps, dirspec.backfill_units.timesteps),
+        seconds = COALESCE(EXCLUDED.seconds, dirspec.backfill_units.seconds),
+        error = EXCLUDED.error,
+        attempts = dirspec.backfill_units.attempts + EXCLUDED.attempts,
+        updated_at = now()
+"""
+
+# each pool worker's own connection, opened once per process after the fork
+worker_conn = None
+
+
+def mark_unit(conn, station_id, year, status, timesteps=None, seconds=None, error=None):
+    with conn.cursor() as cur:
+        cur.execute(MARK_SQL, {'station_id': station_id, 'year': year, 'status': status,
+                               'timesteps': timesteps, 'seconds': seconds, 'error': error})
+    conn.commit()
+
+
+def done_units(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT station_id, year FROM dirspec.backfill_units WHERE status = 'done'")
+        done = set(cur.fetchall())
+    # nothing left open while the pool forks
+    conn.commit()
+    return done
+
+
+def catalog_ids(conn):
+    # {lowercased station_id: station_id as dirspec.buoys has it}, archive names aren't consistent about case
+    with conn.cursor() as cur:
+        cur.execute("SELECT station_id FROM dirspec.buoys")
+        ids = {station_id.lower(): station_id for (station_id,) in cur.fetchall()}
+    conn.commit()
+    return ids
+
+
+def stored_timesteps(conn, station_id, year):
+    # timesteps of the station-year with spectra in the db, from this run or an earlier one
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT count(*)
+            FROM dirspec.time_steps ts
+            JOIN dirspec.buoys b ON b.id = ts.buoy_id
+            WHERE b.station_id = %(station_id)s
+              AND ts.spectra_ingested
+              AND ts.timestamp >= make_timestamptz(%(year)s, 1, 1, 0, 0, 0, 'UTC')
+              AND ts.timestamp < make_timestamptz(%(year)s + 1, 1, 1, 0, 0, 0, 'UTC')
+        """, {'station_id': station_id, 'year': year})
+        count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+
+def forget_unit(conn, archive_id, station_id, year):
+    # an earlier failure recorded under the archive's spelling, before the catalog had the station
+    if archive_id == station_id:
+        return
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM dirspec.backfill_units WHERE station_id = %s AND year = %s", (archive_id, year))
+    conn.commit()
+
+
+def plan_units(conn, directory, stations=None, redo=False):
+    # ([(station_id, year, paths)] still to do, biggest first so the long units don't start last,
+    #  [(station_id, year)] that can't be loaded because the station isn't in the catalog)
+    units = find_archives(directory, stations)
+    done = set() if redo else done_units(conn)
+    catalog = catalog_ids(conn)
+    todo = []
+    unresolved = []
+    for (archive_id, year), paths in units.items():
+        # time_steps rows are joined to dirspec.buoys, a station it doesn't have would load nothing
+        station_id = catalog.get(archive_id)
+        missing = [ext for ext in pull_buoy_data.FILE_EXTS if ext not in paths]
+        if missing:
+            print(f"Skipping {archive_id} {year}: missing {', '.join(missing)}")
+        elif station_id is None:
+            error = f"station {archive_id} is not in dirspec.buoys, sync the catalog first"
+            print(f"Skipping {archive_id} {year}: {error}")
+            mark_unit(conn, archive_id, year, 'failed', error=error)
+            unresolved.append((archive_id, year))
+        elif (station_id, year) in done:
+            print(f"Skipping {station_id} {year}: already done")
+            forget_unit(conn, archive_id, station_id, year)
+        else:
+            todo.append((station_id, year, paths))
+            forget_unit(conn, archive_id, station_id, year)
+    todo.sort(key=lambda unit: -sum(os.path.getsize(p) for p in unit[2].values()))
+    return todo, unresolved
+
+
+def describe(e):
+    return f"{type(e).__name__}: {e}".strip()
+
+
+def run_unit(conn, station_id, year, paths, chunk_rows=CHUNK_ROWS, batch_size=BATCH_SIZE,
+             estimator=pull_buoy_data.ESTIMATOR):
+    # backfills one station-year and records how it went, returns (timesteps or None, seconds, error).
+    # timesteps already flagged are skipped by process_station, so rerunning a unit is safe.
+    # nothing raised here gets past this unit, bookkeeping errors included
+    start = time.perf_counter()
+    try:
+        mark_unit(conn, station_id, year, 'running')
+        steps = backfill_unit(conn, station_id, paths, chunk_rows, batch_size, estimator)
+        # rows that lined up but never made it in must not leave the unit marked done
+        if steps and not stored_timesteps(conn, station_id, year):
+            raise RuntimeError(f"{steps} timesteps parsed but none were written for {station_id} {year}")
+        elapsed = time.perf_counter() - start
+        mark_unit(conn, station_id, year, 'done', steps, elapsed)
+        return steps, elapsed, None
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        error = describe(e)
+        try:
+            conn.rollback()
+            mark_unit(conn, station_id, year, 'failed', seconds=elapsed, error=error)
+        except psycopg2.Error:
+            # the connection itself is gone, the unit stays 'running' and is retried next time
+            pass
+        return None, elapsed, error
+
+
+def init_worker():
+    # a worker that can't connect yet still starts, otherwise the pool keeps replacing it forever.
+    # pool_unit retries the connect and reports it against the unit
+    global worker_conn
+    try:
+        worker_conn = pull_buoy_data.connect()
+    except Exception:
+        worker_conn = None
+
+
+def pool_unit(task):
+    # runs in a pool worker, a missing or dropped connection is opened again for the next unit.
+    # always returns (station_id, year, timesteps or None, seconds, error) so the parent keeps going
+    global worker_conn
+    station_id, year, paths, chunk_rows, batch_size, estimator = task
+    start = time.perf_counter()
+    try:
+        if worker_conn is None or worker_conn.closed:
+            worker_conn = pull_buoy_data.connect()
+        return (station_id, year) + run_unit(worker_conn, station_id, year, paths, chunk_rows, batch_size, estimator)
+    except Exception as e:
+        return station_id, year, None, time.perf_counter() - start, describe(e)
+
+
+def backfill(conn, directory, stations=None, chunk_rows=CHUNK_ROWS, batch_size=BATCH_SIZE,
+             estimator=pull_buoy_data.ESTIMATOR, workers=1, redo=False):
+    # with more than one worker, station-years are spread over a process pool, each worker with
+    # its own connection and its own bulk writes
+    todo, unresolved = plan_units(conn, directory, stations, redo)
+    # rows landing in time_steps, spectra_parameters and the directional table per timestep,
+    # the packed layout writes one directional row per timestep instead of one per (freq, direction)
+    F = len(pull_buoy_data.freqs)
+    rows_per_step = 1 + F + (1 if DIRECTIONAL_LAYOUT == 'packed' else F * len(DIRECTIONS))
+
+    tasks = [(station_id, year, paths, chunk_rows, batch_size, estimator) for station_id, year, paths in todo]
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.get_context('fork').Pool(min(workers, len(tasks)), initializer=init_worker)
+        results = pool.imap_unordered(pool_unit, tasks)
+    else:
+        pool = None
+        results = ((t[0], t[1]) + run_unit(conn, *t) for t in tasks)
+
+    total_steps = 0
+    failed = list(unresolved)
+    start = time.perf_counter()
+    try:
+        for n, (station_id, year, steps, elapsed, error) in enumerate(results, 1):
+            if error is not None:
+                failed.append((station_id, year))
+                print(f"[{n}/{len(tasks)}] {station_id} {year}: failed after {elapsed:.1f}s, {error}")
+                continue
+            total_steps += steps
+            print(f"[{n}/{len(tasks)}] {station_id} {year}: {steps} timesteps in {elapsed:.1f}s "
+                  f"({steps / max(elapsed, 1e-9):.0f} timesteps/s, {steps * rows_per_step / max(elapsed, 1e-9):.0f} rows/s)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    if elapsed > 0:
+        print(f"Backfilled {total_steps} timesteps from {len(tasks) + len(unresolved) - len(failed)} station-years in {elapsed:.1f}s "
+              f"with {max(1, min(workers, len(tasks)))} worker(s) "
+              f"({total_steps / elapsed:.0f} timesteps/s, {total_steps * rows_per_step / elapsed:.0f} rows/s)")
+    if failed:
+        print(f"{len(failed)} station-years failed, rerun to retry them: "
+              f"{', '.join(f'{s} {y}' for s, y in sorted(failed))}")
+    return total_steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load NDBC historical yearly archives from a local directory")
+    parser.add_argument("directory", help="folder holding e.g. 46026h2019.txt.gz, 46026w2019.txt.gz, 46026d2019.txt.gz ...")
+    parser.add_argument("--stations", nargs="*", help="only these station ids")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="data lines read per file per step")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="timesteps per spectra transaction")
+    parser.add_argument("--estimator", choices=sorted(ESTIMATORS), default=pull_buoy_data.ESTIMATOR,
+                        help="directional spreading estimator")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes loading station-years in parallel")
+    parser.add_argument("--redo", action="store_true", help="also rerun station-years already marked done")
+    args = parser.parse_args()
+
+    conn = pull_buoy_data.connect()
+    pull_buoy_data.create_tables(conn)
+    stations = {s.lower() for s in args.stations} if args.stations else None
+    backfill(conn, args.directory, stations, args.chunk_rows, args.batch_size, args.estimator, args.workers, args.redo)
+    conn.close()
@@ -0,0 +1,264 @@
+import io
+import numpy as np
+import pandas as pd
+
+# timesteps written per transaction (one COPY per table, one upsert, one flag update)
+BATCH_SIZE = 200
+
+# how spreading is written: 'packed' is one spectra_directional_packed row per timestep,
+# 'rows' is the original one spectra_directional row per (frequency, direction)
+DIRECTIONAL_LAYOUT = 'packed'
+
+# element type of the packed blocks, big-endian to match postgres float4send
+PACKED_DTYPE = '>f4'
+
+# channel the viewer's cache listens on, notified with the ids whose spectra were just written
+INGEST_CHANNEL = 'dirspec_ingest'
+
+# time_step ids per notification, keeps the payload well under postgres' 8000 byte limit
+NOTIFY_IDS = 500
+
+# time_steps columns carried over from the .txt file plus the derived parameters
+TS_COLUMNS = ['WDIR', 'WSPD', 'GST', 'WVHT', 'DPD', 'APD', 'MWD', 'PRES', 'ATMP',
+              'WTMP', 'DEWP', 'VIS', 'PTDY', 'TIDE', 'm0', 'hm0', 'm_1', 'Te', 'P']
+
+
+def copy_frame(cur, table, df):
+    # stream a DataFrame through COPY FROM STDIN, NaN goes in as NULL
+    buf = io.StringIO()
+    df.to_csv(buf, sep='\t', header=False, index=False, na_rep='\\N')
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN", buf)
+
+
+def load_time_steps(conn, df_txt):
+    df = df_txt.reindex(columns=['station_id', 'datetime'] + TS_COLUMNS)
+    df = df.rename(columns={'datetime': 'timestamp'})
+
+    cols = ', '.join(TS_COLUMNS)
+    with conn.cursor() as cur:
+        # everything numeric is staged as double, the insert casts WDIR back to integer
+        cur.execute(f"""
+            CREATE TEMP TABLE stage_time_steps (
+                station_id TEXT,
+                timestamp TIMESTAMPTZ,
+                {', '.join(f'{c} DOUBLE PRECISION' for c in TS_COLUMNS)}
+            ) ON COMMIT DROP
+        """)
+        copy_frame(cur, 'stage_time_steps', df)
+
+        cur.execute(f"""
+            INSERT INTO dirspec.time_steps (buoy_id, timestamp, {cols})
+            SELECT b.id, s.timestamp, {cols}
+            FROM stage_time_steps s
+            JOIN dirspec.buoys b ON b.station_id = s.station_id
+            ON CONFLICT (buoy_id, timestamp) DO NOTHING
+        """)
+
+        # resolve every staged (station_id, timestamp) to its time_steps.id in one join,
+        # rows that already existed are included since the staging table still has them
+        cur.execute("""
+            SELECT s.station_id, ts.timestamp, ts.id, COALESCE(ts.spectra_ingested, FALSE)
+            FROM stage_time_steps s
+            JOIN dirspec.buoys b ON b.station_id = s.station_id
+            JOIN dirspec.time_steps ts ON ts.buoy_id = b.id AND ts.timestamp = s.timestamp
+        """)
+        ts_lookup = {
+            (station_id, pd.Timestamp(ts).tz_convert('UTC')): (ts_id, ingested)
+            for station_id, ts, ts_id, ingested in cur.fetchall()
+        }
+    conn.commit()
+
+    # {(station_id, timestamp): (time_step_id, spectra_ingested)}
+    return ts_lookup
+
+
+def array_literal(values):
+    return '{' + ','.join(repr(float(v)) for v in values) + '}'
+
+
+def bytea_literal(values):
+    # hex bytea input, the backslash is doubled because COPY text format unescapes it once
+    return '\\\\x' + np.ascontiguousarray(values, dtype=PACKED_DTYPE).tobytes().hex()
+
+
+def packed_frame(timestep_ids, freqs, Ef, D, directions, estimator='fourier'):
+    # one row per timestep, D flattened frequency-major so row i of the F×Θ matrix is D[i*Θ:(i+1)*Θ]
+    T = len(Ef)
+    D = D.reshape(T, -1)
+    return pd.DataFrame({
+        'time_step_id': np.asarray(timestep_ids, dtype=np.int64),
+        'frequencies': array_literal(freqs),
+        'directions': array_literal(directions),
+        'energy_density': [bytea_literal(row) for row in Ef],
+        'spreading': [bytea_literal(row) for row in D],
+        'estimator': estimator,
+    })
+
+
+def spectra_frames(timestep_ids, freqs, Ef, alpha1, alpha2, r1, r2, D, directions, layout=DIRECTIONAL_LAYOUT,
+                   estimator='fourier'):
+    # flatten T×F and T×F×Θ blocks into long tables without a Python loop per row
+    T, F = Ef.shape
+    ids = np.asarray(timestep_ids, dtype=np.int64)
+
+    df_params = pd.DataFrame({
+        'time_step_id': np.repeat(ids, F),
+        'frequency': np.tile(freqs, T),
+        'energy_density': Ef.ravel(),
+        'alpha1': alpha1.ravel(),
+        'alpha2': alpha2.ravel(),
+        'r1': r1.ravel(),
+        'r2': r2.ravel(),
+    })
+
+    if layout == 'packed':
+        return df_params, packed_frame(timestep_ids, freqs, Ef, D, directions, estimator)
+
+    # the row layout predates the other estimators and has nowhere to record one
+    if estimator != 'fourier':
+        raise ValueError(f"The rows layout only stores the fourier estimate, not {estimator!r}")
+
+    n_dir = len(directions)
+    df_dir = pd.DataFrame({
+        'time_step_id': np.repeat(ids, F * n_dir),
+        'frequency': np.tile(np.repeat(freqs, n_dir), T),
+        'direction': np.tile(directions, T * F),
+        'spreading': D.ravel(),
+    })
+    return df_params, df_dir
+
+
+def insert_stats(cur, df_stats):
+    # stages the rows and inserts whatever isn't there yet, so a concurrent ingest or stats
+    # backfill writing the same timesteps can't fail the transaction. returns the rows inserted
+    cur.execute(f"""
+        CREATE TEMP TABLE stage_spectral_stats (
+            time_step_id INTEGER,
+            {', '.join(f'{c} DOUBLE PRECISION' for c in df_stats.columns[1:])}
+        ) ON COMMIT DROP;
+    """)
+    copy_frame(cur, 'stage_spectral_stats', df_stats)
+    cols = ', '.join(df_stats.columns)
+    cur.execute(f"""
+        INSERT INTO dirspec.spectral_stats ({cols})
+        SELECT {cols} FROM stage_spectral_stats
+        ON CONFLICT (time_step_id) DO NOTHING;
+    """)
+    return cur.rowcount
+
+
+def load_spectra_batch(conn, timestep_ids, df_params, df_dir, layout=DIRECTIONAL_LAYOUT, df_stats=None):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE stage_spectra_parameters (
+                time_step_id INTEGER,
+                frequency DOUBLE PRECISION,
+                energy_density DOUBLE PRECISION,
+                alpha1 DOUBLE PRECISION,
+                alpha2 DOUBLE PRECISION,
+                r1 DOUBLE PRECISION,
+                r2 DOUBLE PRECISION
+            ) ON COMMIT DROP;
+        """)
+        copy_frame(cur, 'stage_spectra_parameters', df_params)
+
+        cur.execute("""
+            INSERT INTO dirspec.spectra_parameters (time_step_id, frequency, energy_density, alpha1, alpha2, r1, r2)
+            SELECT time_step_id, frequency, energy_density, alpha1, alpha2, r1, r2
+            FROM stage_spectra_parameters
+            ON CONFLICT (time_step_id, frequency) DO NOTHING;
+        """)
+
+        if layout == 'packed':
+            cur.execute("""
+                CREATE TEMP TABLE stage_spectra_directional_packed (
+                    time_step_id INTEGER,
+                    frequencies REAL[],
+                    directions REAL[],
+                    energy_density BYTEA,
+                    spreading BYTEA,
+                    estimator TEXT
+                ) ON COMMIT DROP;
+            """)
+            copy_frame(cur, 'stage_spectra_directional_packed', df_dir)
+
+            cur.execute("""
+                INSERT INTO dirspec.spectra_directional_packed (time_step_id, frequencies, directions, energy_density, spreading, estimator)
+                SELECT time_step_id, frequencies, directions, energy_density, spreading, estimator
+                FROM stage_spectra_directional_packed
+                ON CONFLICT (time_step_id) DO NOTHING;
+            """)
+        else:
+            cur.execute("""
+                CREATE TEMP TABLE stage_spectra_directional (
+                    time_step_id INTEGER,
+                    frequency DOUBLE PRECISION,
+                    direction INTEGER,
+                    spreading DOUBLE PRECISION
+                ) ON COMMIT DROP;
+            """)
+            copy_frame(cur, 'stage_spectra_directional', df_dir)
+
+            cur.execute("""
+                INSERT INTO dirspec.spectra_directional (time_step_id, frequency, direction, spreading)
+                SELECT time_step_id, frequency, direction, spreading
+                FROM stage_spectra_directional
+                ON CONFLICT (time_step_id, frequency, direction) DO NOTHING;
+            """)
+
+        # one spectral_stats row per timestep, written with its spectra so a flagged timestep always has one
+        if df_stats is not None:
+            insert_stats(cur, df_stats)
+
+        # one flag update for the whole batch, and the newly flagged rows folded into the
+        # per-station availability summary the viewer's map reads
+        cur.execute("""
+            WITH flagged AS (
+                UPDATE dirspec.time_steps
+                SET spectra_ingested = TRUE
+                WHERE id = ANY(%s) AND NOT COALESCE(spectra_ingested, FALSE)
+                RETURNING buoy_id, timestamp, hm0, p
+            )
+            INSERT INTO dirspec.station_availability
+                (buoy_id, first_timestamp, last_timestamp, n_timesteps, latest_hm0, latest_p, updated_at)
+            SELECT buoy_id, min(timestamp), max(timestamp), count(*),
+                   (array_agg(hm0 ORDER BY timestamp DESC))[1], (array_agg(p ORDER BY timestamp DESC))[1], now()
+            FROM flagged
+            GROUP BY buoy_id
+            ON CONFLICT (buoy_id) DO UPDATE
+            SET first_timestamp = LEAST(dirspec.station_availability.first_timestamp, EXCLUDED.first_timestamp),
+                last_timestamp = GREATEST(dirspec.station_availability.last_timestamp, EXCLUDED.last_timestamp),
+                n_timesteps = dirspec.station_availability.n_timesteps + EXCLUDED.n_timesteps,
+                -- a backfill batch can be older than what's already there, the newest timestep wins
+                latest_hm0 = CASE WHEN EXCLUDED.last_timestamp >= dirspec.station_availability.last_timestamp
+                                  THEN EXCLUDED.latest_hm0 ELSE dirspec.station_availability.latest_hm0 END,
+                latest_p = CASE WHEN EXCLUDED.last_timestamp >= dirspec.station_availability.last_timestamp
+                                THEN EXCLUDED.latest_p ELSE dirspec.station_availability.latest_p END,
+                updated_at = now()
+        """, ([int(i) for i in timestep_ids],))
+
+        # delivered on commit, so listeners never see ids whose spectra aren't visible yet
+        for start in range(0, len(timestep_ids), NOTIFY_IDS):
+            cur.execute("""
+                SELECT pg_notify(%s, json_build_object(
+                    'time_step_ids', array_agg(ts.id),
+                    'station_ids', array_agg(DISTINCT b.station_id)
+                )::text)
+                FROM dirspec.time_steps ts
+                JOIN dirspec.buoys b ON b.id = ts.buoy_id
+                WHERE ts.id = ANY(%s)
+            """, (INGEST_CHANNEL, [int(i) for i in timestep_ids[start:start + NOTIFY_IDS]]))
+    conn.commit()
+
+
+def load_spectra(conn, timestep_ids, freqs, Ef, alpha1, alpha2, r1, r2, D, directions, batch_size=BATCH_SIZE,
+                 layout=DIRECTIONAL_LAYOUT, df_stats=None, estimator='fourier'):
+    # each batch of timesteps is its own transaction. df_stats, if given, has one row per timestep in the same order
+    for start in range(0, len(timestep_ids), batch_size):
+        stop = start + batch_size
+        df_params, df_dir = spectra_frames(
+            timestep_ids[start:stop], freqs, Ef[start:stop], alpha1[start:stop],
+            alpha2[start:stop], r1[start:stop], r2[start:stop], D[start:stop], directions, layout, estimator)
+        batch_stats = df_stats.iloc[start:stop] if df_stats is not None else None
+        load_spectra_batch(conn, timestep_ids[start:stop], df_params, df_dir, layout, batch_stats)
@@ -0,0 +1,164 @@
+import argparse
+import csv
+import io
+import os
+import time
+import urllib.request
+import xml.etree.ElementTree as ET
+
+import pull_buoy_data
+
+# NDBC's live catalog, and the copy kept in the repo
+CATALOG_URL = "https://www.ndbc.noaa.gov/activestations.xml"
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'activestations.xml')
+
+# stations staged per COPY, memory stays flat however large the catalog gets
+CHUNK_STATIONS = 500
+
+# staged columns, in the order iter_stations yields them
+STAGE_COLUMNS = ["station_id", "name", "lat", "lon", "elev", "owner", "program", "station_type"]
+
+# one statement: new stations inserted, changed (or returning) ones updated, and, when
+# deactivating, active stations missing from the catalog marked inactive. unchanged rows aren't
+# touched. a station listed twice keeps its last entry
+SYNC_SQL = """
+    WITH latest AS (
+        SELECT DISTINCT ON (station_id) {cols}
+        FROM stage_buoys
+        ORDER BY station_id, line DESC
+    ),
+    upserted AS (
+        INSERT INTO dirspec.buoys ({cols}, active, catalog_updated_at)
+        SELECT {cols}, TRUE, now() FROM latest
+        ON CONFLICT (station_id) DO UPDATE
+        SET {updates}, active = TRUE, catalog_updated_at = now()
+        WHERE ({current}) IS DISTINCT FROM ({excluded}) OR NOT dirspec.buoys.active
+        RETURNING (xmax = 0) AS inserted
+    ),
+    deactivated AS (
+        UPDATE dirspec.buoys b
+        SET active = FALSE, catalog_updated_at = now()
+        WHERE %(deactivate)s AND b.active
+          AND NOT EXISTS (SELECT 1 FROM stage_buoys s WHERE s.station_id = b.station_id)
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM latest),
+           count(*) FILTER (WHERE inserted),
+           count(*) FILTER (WHERE NOT inserted),
+           (SELECT count(*) FROM deactivated)
+    FROM upserted
+""".format(
+    cols=", ".join(STAGE_COLUMNS),
+    updates=", ".join(f"{c} = EXCLUDED.{c}" for c in STAGE_COLUMNS[1:]),
+    current=", ".join(f"dirspec.buoys.{c}" for c in STAGE_COLUMNS[1:]),
+    excluded=", ".join(f"EXCLUDED.{c}" for c in STAGE_COLUMNS[1:]),
+)
+
+
+def open_catalog(source):
+    if source.startswith(("http://", "https://")):
+        return urllib.request.urlopen(source, timeout=60)
+    return open(source, "rb")
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_stations(f):
+    # one tuple per <station>, parsed as the file streams in. each element is cleared once read
+    for _, elem in ET.iterparse(f, events=("end",)):
+        if elem.tag != "station":
+            continue
+        lat, lon = to_float(elem.get("lat")), to_float(elem.get("lon"))
+        if elem.get("id") and lat is not None and lon is not None:
+            yield (elem.get("id"), elem.get("name"), lat, lon, to_float(elem.get("elev")),
+                   elem.get("owner"), elem.get("pgm"), elem.get("type"))
+        else:
+            print(f"Skipping catalog entry without id or position: {dict(elem.attrib)}")
+        elem.clear()
+
+
+def copy_rows(cur, rows):
+    # csv COPY, so names with tabs or backslashes go in untouched. None goes in as NULL
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    cur.copy_expert(f"COPY stage_buoys ({', '.join(STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def sync_catalog(conn, source=CATALOG_PATH, deactivate=True, dry_run=False, chunk_stations=CHUNK_STATIONS):
+    # brings dirspec.buoys in line with an activestations.xml file or url,
+    # returns {"parsed", "stations", "inserted", "updated", "deactivated", "unchanged", "seconds"}
+    start = time.perf_counter()
+    parsed = 0
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE stage_buoys (
+                line SERIAL,
+                station_id TEXT,
+                name TEXT,
+                lat DOUBLE PRECISION,
+                lon DOUBLE PRECISION,
+                elev DOUBLE PRECISION,
+                owner TEXT,
+                program TEXT,
+                station_type TEXT
+            ) ON COMMIT DROP
+        """)
+        chunk = []
+        with open_catalog(source) as f:
+            for row in iter_stations(f):
+                chunk.append(row)
+                if len(chunk) == chunk_stations:
+                    copy_rows(cur, chunk)
+                    parsed += len(chunk)
+                    chunk = []
+        if chunk:
+            copy_rows(cur, chunk)
+            parsed += len(chunk)
+        parse_seconds = time.perf_counter() - start
+
+        # an empty or truncated download must not deactivate every station
+        if parsed == 0:
+            conn.rollback()
+            raise ValueError(f"No stations found in {source}, dirspec.buoys left unchanged")
+
+        cur.execute(SYNC_SQL, {"deactivate": deactivate})
+        stations, inserted, updated, deactivated = cur.fetchone()
+
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+
+    counts = {
+        "parsed": parsed,
+        "stations": stations,
+        "inserted": inserted,
+        "updated": updated,
+        "deactivated": deactivated,
+        "unchanged": stations - inserted - updated,
+        "seconds": time.perf_counter() - start,
+    }
+    print(f"{'Dry run, nothing written: ' if dry_run else ''}{parsed} catalog entries ({stations} stations) "
+          f"parsed in {parse_seconds:.2f}s, {inserted} added, {updated} updated, {deactivated} deactivated, "
+          f"{counts['unchanged']} unchanged, {counts['seconds']:.2f}s total")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync dirspec.buoys with the NDBC station catalog (activestations.xml)")
+    parser.add_argument("source", nargs="?", default=CATALOG_PATH,
+                        help=f"catalog file or url, default {CATALOG_PATH} (live: {CATALOG_URL})")
+    parser.add_argument("--no-deactivate", action="store_true", help="leave stations missing from the catalog active")
+    parser.add_argument("--dry-run", action="store_true", help="report the counts without writing")
+    args = parser.parse_args()
+
+    conn = pull_buoy_data.connect()
+    pull_buoy_data.create_tables(conn)
+    sync_catalog(conn, args.source, deactivate=not args.no_deactivate, dry_run=args.dry_run)
+    conn.close()
@@ -0,0 +1,125 @@
+import hashlib
+import http.client
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+REALTIME2_URL = "https://www.ndbc.noaa.gov/data/realtime2/"
+
+# the six realtime2 files needed per station
+FILE_EXTS = ["txt", "data_spec", "swdir", "swdir2", "swr1", "swr2"]
+
+# in incremental mode this file is fetched first and decides whether the station changed
+GATE_EXT = "data_spec"
+
+# http codes worth another attempt, anything else is treated as final
+RETRY_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    pass
+
+
+def build_url(base_url, station_id, ext):
+    return f"{base_url.rstrip('/')}/{station_id}.{ext}"
+
+
+def conditional_headers(validators):
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def fetch_file(url, host_limits, timeout=30, retries=3, backoff=1.0, validators=None):
+    # returns (text, validators), text is None for a missing file or a 304 (validators passed through)
+    host = urlsplit(url).netloc
+    request = urllib.request.Request(url, headers=conditional_headers(validators))
+    for attempt in range(retries + 1):
+        try:
+            # hold the host slot only while the request is in flight, not while backing off
+            with host_limits[host]:
+                with urllib.request.urlopen(request, timeout=timeout) as resp:
+                    text = resp.read().decode("utf-8", errors="replace")
+                    return text, {
+                        "etag": resp.headers.get("ETag"),
+                        "last_modified": resp.headers.get("Last-Modified"),
+                        "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                    }
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None, validators
+            # not every station publishes every file, a 404 is an answer not a failure
+            if e.code == 404:
+                return None, None
+            if e.code not in RETRY_CODES or attempt == retries:
+                raise FetchError(f"{url}: HTTP {e.code}") from e
+        # a body cut short raises IncompleteRead, an HTTPException rather than an OSError
+        except (urllib.error.URLError, TimeoutError, ConnectionError, http.client.HTTPException) as e:
+            if attempt == retries:
+                raise FetchError(f"{url}: {e}") from e
+        time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_stations(station_ids, base_url=REALTIME2_URL, exts=FILE_EXTS, max_workers=32,
+                   per_host=6, timeout=30, retries=3, backoff=1.0, validators=None):
+    # yields (station_id, {ext: text or None}, {ext: validators}) as soon as all files for a
+    # station are in, so parsing and db writes for early stations overlap the remaining downloads.
+    # validators ({station_id: {ext: {...}}} from the last run) turns on incremental mode: the gate
+    # file is fetched conditionally first and, if it is unchanged, the station is yielded with
+    # files=None without downloading the rest
+    station_ids = [str(s) for s in station_ids]
+    validators = validators or {}
+    urls = {(s, ext): build_url(base_url, s, ext) for s in station_ids for ext in exts}
+
+    # one bounded semaphore per host, built up front so workers never race to create them
+    host_limits = {urlsplit(u).netloc: threading.BoundedSemaphore(per_host) for u in urls.values()}
+
+    files = {s: {} for s in station_ids}
+    new_validators = {s: {} for s in station_ids}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+
+        def submit(station_id, ext, previous=None):
+            fut = pool.submit(fetch_file, urls[(station_id, ext)], host_limits, timeout, retries, backoff, previous)
+            futures[fut] = (station_id, ext)
+
+        for s in station_ids:
+            if s in validators and GATE_EXT in exts:
+                submit(s, GATE_EXT, validators[s].get(GATE_EXT))
+            else:
+                for ext in exts:
+                    submit(s, ext)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                station_id, ext = futures.pop(fut)
+                try:
+                    text, vals = fut.result()
+                except FetchError as e:
+                    print(f"Fetch failed: {e}")
+                    text, vals = None, None
+                files[station_id][ext] = text
+                new_validators[station_id][ext] = vals
+
+                if station_id in validators and ext == GATE_EXT:
+                    previous = validators[station_id].get(GATE_EXT) or {}
+                    # a 304 hands back the old validators, a 200 with the same body is unchanged too
+                    if vals is not None and (text is None or vals.get("sha1") == previous.get("sha1")):
+                        files.pop(station_id)
+                        yield station_id, None, new_validators.pop(station_id)
+                        continue
+                    for other in exts:
+                        if other != GATE_EXT:
+                            submit(station_id, other)
+
+                if len(files[station_id]) == len(exts):
+                    yield station_id, files.pop(station_id), new_validators.pop(station_id)
@@ -0,0 +1,51 @@
+import json
+import pandas as pd
+
+# header lines at the top of each realtime2 file (.txt carries a units row as well)
+HEADER_LINES = {"txt": 2, "data_spec": 1, "swdir": 1, "swdir2": 1, "swr1": 1, "swr2": 1}
+
+
+def load_ingest_state(conn, station_ids):
+    # {station_id: (high_water, validators)} for stations that have been ingested before
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT station_id, high_water, validators
+            FROM dirspec.ingest_state
+            WHERE station_id = ANY(%s)
+        """, ([str(s) for s in station_ids],))
+        return {station_id: (high_water, validators or {}) for station_id, high_water, validators in cur.fetchall()}
+
+
+def save_ingest_state(conn, station_id, high_water, validators):
+    # the watermark only ever moves forward, validators always reflect the latest fetch
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO dirspec.ingest_state (station_id, high_water, validators, updated_at)
+            VALUES (%s, %s, %s::jsonb, now())
+            ON CONFLICT (station_id) DO UPDATE
+            SET high_water = GREATEST(dirspec.ingest_state.high_water, EXCLUDED.high_water),
+                validators = EXCLUDED.validators,
+                updated_at = now()
+        """, (str(station_id), high_water, json.dumps(validators)))
+    conn.commit()
+
+
+def new_rows(text, high_water, header_lines):
+    # NDBC files are newest-first, so keep the header plus leading rows until the watermark is reached.
+    # returns None when there is nothing newer than the watermark
+    hw = pd.Timestamp(high_water).tz_convert("UTC")
+    hw_key = (hw.year, hw.month, hw.day, hw.hour, hw.minute)
+
+    lines = text.splitlines(keepends=True)
+    end = header_lines
+    for line in lines[header_lines:]:
+        fields = line.split(None, 5)
+        if len(fields) < 5:
+            break
+        if tuple(int(x) for x in fields[:5]) <= hw_key:
+            break
+        end += 1
+
+    if end == header_lines:
+        return None
+    return "".join(lines[:end])
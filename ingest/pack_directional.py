@@ -0,0 +1,92 @@
+import argparse
+import time
+
+import pull_buoy_data
+
+# time_steps ids handled per transaction
+WINDOW = 500
+
+# one packed row per timestep, built entirely in postgres. float4send gives the same
+# big-endian float4 bytes the ingester writes (NULLs, the row layout's NaN, go back to NaN so
+# every block keeps its full length), and timesteps with a ragged grid are left alone
+PACK_SQL = """
+    INSERT INTO dirspec.spectra_directional_packed (time_step_id, frequencies, directions, energy_density, spreading)
+    SELECT d.time_step_id, d.frequencies, d.directions, p.energy_density, d.spreading
+    FROM (
+        SELECT time_step_id,
+               array_agg(DISTINCT frequency::real ORDER BY frequency::real) AS frequencies,
+               array_agg(DISTINCT direction::real ORDER BY direction::real) AS directions,
+               string_agg(float4send(COALESCE(spreading::real, 'NaN')), ''::bytea ORDER BY frequency, direction) AS spreading,
+               count(*) AS n
+        FROM dirspec.spectra_directional
+        WHERE time_step_id >= %(lo)s AND time_step_id < %(hi)s
+        GROUP BY time_step_id
+    ) d
+    CROSS JOIN LATERAL (
+        SELECT string_agg(float4send(COALESCE(energy_density::real, 'NaN')), ''::bytea ORDER BY frequency) AS energy_density,
+               count(*) AS n
+        FROM dirspec.spectra_parameters sp
+        WHERE sp.time_step_id = d.time_step_id
+          AND sp.frequency::real = ANY(d.frequencies)
+    ) p
+    WHERE d.n = cardinality(d.frequencies) * cardinality(d.directions)
+      AND p.n = cardinality(d.frequencies)
+    ON CONFLICT (time_step_id) DO NOTHING
+"""
+
+DROP_SQL = """
+    DELETE FROM dirspec.spectra_directional d
+    USING dirspec.spectra_directional_packed pk
+    WHERE d.time_step_id = pk.time_step_id
+      AND d.time_step_id >= %(lo)s AND d.time_step_id < %(hi)s
+"""
+
+
+def table_rows(cur, table):
+    cur.execute(f"SELECT count(*) FROM {table}")
+    return cur.fetchone()[0]
+
+
+def pack_directional(conn, window=WINDOW, drop_rows=False):
+    # copies every timestep of spectra_directional into spectra_directional_packed, window by window.
+    # safe to rerun, already packed timesteps are skipped
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(time_step_id), max(time_step_id) FROM dirspec.spectra_directional")
+        first, last = cur.fetchone()
+        before = table_rows(cur, 'dirspec.spectra_directional')
+    if first is None:
+        print("Nothing to pack, spectra_directional is empty")
+        return 0
+
+    packed = 0
+    start = time.perf_counter()
+    for lo in range(first, last + 1, window):
+        bounds = {'lo': lo, 'hi': lo + window}
+        with conn.cursor() as cur:
+            cur.execute(PACK_SQL, bounds)
+            packed += cur.rowcount
+            if drop_rows:
+                cur.execute(DROP_SQL, bounds)
+        conn.commit()
+        print(f"Packed through time_step_id {min(lo + window, last + 1) - 1}/{last} ({packed} timesteps)")
+
+    with conn.cursor() as cur:
+        after = table_rows(cur, 'dirspec.spectra_directional')
+        rows_packed = table_rows(cur, 'dirspec.spectra_directional_packed')
+    print(f"Packed {packed} timesteps in {time.perf_counter() - start:.1f}s: spectra_directional {before} -> {after} rows, "
+          f"spectra_directional_packed {rows_packed} rows")
+    if drop_rows:
+        print("Run VACUUM FULL dirspec.spectra_directional to hand the freed space back to the OS")
+    return packed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate spectra_directional rows to the packed one-row-per-timestep layout")
+    parser.add_argument("--window", type=int, default=WINDOW, help="time_step ids per transaction")
+    parser.add_argument("--drop-rows", action="store_true", help="delete the per-direction rows once packed")
+    args = parser.parse_args()
+
+    conn = pull_buoy_data.connect()
+    pull_buoy_data.create_tables(conn)
+    pack_directional(conn, args.window, args.drop_rows)
+    conn.close()
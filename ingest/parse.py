@@ -0,0 +1,224 @@
+from collections import namedtuple
+import numpy as np
+
+# missing value markers used across the NDBC spectral files
+MISSING = 999.0
+
+# bytes of the file body handled per pass, caps the size of the per-token temporaries
+BLOCK_BYTES = 1 << 22
+
+# times: datetime64[m] (UTC), freqs: float32 F, values: float32 T×F, sep_freq: float32 T or None
+SpectralBlock = namedtuple("SpectralBlock", ["times", "freqs", "values", "sep_freq"])
+
+
+def is_number(token):
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
+
+def token_bounds(buf):
+    # start/end offsets of every whitespace separated token in a uint8 buffer
+    solid = buf > 32
+    edges = np.flatnonzero(solid[1:] != solid[:-1]).astype(np.int32)
+    edges += 1
+    if len(buf) and solid[0]:
+        edges = np.concatenate(([0], edges))
+    if len(buf) and solid[-1]:
+        edges = np.concatenate((edges, [len(buf)]))
+    return edges[0::2], edges[1::2]
+
+
+def decode_numbers(buf, starts, ends):
+    # decimal tokens ([-]digits[.digits]) decoded with array ops instead of one float() per token,
+    # walking the tokens one character column at a time. tokens the walk can't hold exactly (more
+    # digits than int64 has room for, exponents, a leading +) go through float() instead.
+    # anything else in a token (MM) is NaN
+    lengths = ends - starts
+    if len(starts) == 0:
+        return np.empty(0, dtype=np.float64)
+    shortest, longest = int(lengths.min()), int(lengths.max())
+    last = len(buf) - 1
+
+    mantissa = np.zeros(len(starts), dtype=np.int64)
+    digits = np.zeros(len(starts), dtype=np.int32)
+    decimals = np.zeros(len(starts), dtype=np.int32)
+    seen_dot = np.zeros(len(starts), dtype=bool)
+    bad = np.zeros(len(starts), dtype=bool)
+    fallback = np.zeros(len(starts), dtype=bool)
+    negative = buf[starts] == 45
+
+    for k in range(longest):
+        # columns every token reaches need no bounds handling
+        if k < shortest:
+            chars = buf[starts + k]
+        else:
+            chars = buf[np.minimum(starts + k, last)]
+
+        # unsigned wrap-around turns the digit test into one comparison
+        value = chars - np.uint8(48)
+        digit = value < 10
+        dot = chars == 46
+        other = (chars == 101) | (chars == 69) | (chars == 43)
+        if k > 0:
+            # a sign past the first column only makes sense after an exponent
+            other |= chars == 45
+        if k >= shortest:
+            inside = k < lengths
+            digit &= inside
+            dot &= inside
+            other &= inside
+
+        mantissa = np.where(digit, mantissa * 10 + value, mantissa)
+        digits += digit
+        decimals += digit & seen_dot
+        bad |= dot & seen_dot & ~fallback
+        seen_dot |= dot
+        fallback |= other
+
+        allowed = digit | dot | other
+        if k == 0:
+            allowed |= negative
+        if k >= shortest:
+            allowed |= ~inside
+        bad |= ~allowed
+
+    # a lone sign or dot is not a number either
+    bad |= (digits == 0) & ~fallback
+    values = mantissa / 10.0 ** decimals
+    values[negative] *= -1
+    values[bad] = np.nan
+
+    # 18 digits always fit in int64, longer ones may have wrapped
+    for i in np.flatnonzero((fallback | (digits > 18)) & ~bad):
+        try:
+            values[i] = float(buf[starts[i]:ends[i]].tobytes())
+        except ValueError:
+            values[i] = np.nan
+    return values
+
+
+def to_datetime64(date_cols):
+    # date_cols is T×4 (YY MM DD hh) or T×5 (YY MM DD hh mm) of integers
+    years = date_cols[:, 0]
+    years = np.where(years < 100, years + 1900, years)
+    times = (years - 1970).astype("datetime64[Y]").astype("datetime64[M]")
+    times = times + (date_cols[:, 1] - 1).astype("timedelta64[M]")
+    times = times.astype("datetime64[m]")
+    times = times + (date_cols[:, 2] - 1).astype("timedelta64[D]") + date_cols[:, 3].astype("timedelta64[h]")
+    if date_cols.shape[1] > 4:
+        times = times + date_cols[:, 4].astype("timedelta64[m]")
+    return times
+
+
+def empty_block():
+    return SpectralBlock(np.empty(0, "datetime64[m]"), np.empty(0, np.float32), np.empty((0, 0), np.float32), None)
+
+
+def parse_rows(buf, n_cols, n_date, first_value, step, has_sep):
+    # one line-aligned block of the body -> (times, values, sep_freq)
+    starts, ends = token_bounds(buf)
+
+    # every row must carry the same number of tokens for the fixed layout to hold
+    line_ends = np.append(np.flatnonzero(buf == 10), len(buf))
+    counts = np.diff(np.searchsorted(starts, line_ends), prepend=0)
+    counts = counts[counts > 0]
+    if np.any(counts != n_cols):
+        raise ValueError(f"expected {n_cols} columns on every row, found rows with {sorted(set(counts.tolist()) - {n_cols})}")
+
+    # token offsets as a rows × columns grid, value columns are strided views into it
+    n_rows = len(counts)
+    if n_rows == 0:
+        n_values = len(range(first_value, n_cols, step))
+        sep_freq = np.empty(0, np.float32) if has_sep else None
+        return np.empty(0, "datetime64[m]"), np.empty((0, n_values), np.float32), sep_freq
+    starts = starts.reshape(n_rows, n_cols)
+    ends = ends.reshape(n_rows, n_cols)
+
+    date_cols = decode_numbers(buf, starts[:, :n_date].ravel(), ends[:, :n_date].ravel())
+    times = to_datetime64(date_cols.reshape(n_rows, n_date).astype(np.int64))
+
+    values = decode_numbers(buf, starts[:, first_value::step].ravel(), ends[:, first_value::step].ravel())
+    values = values.reshape(n_rows, -1).astype(np.float32)
+    values[values == MISSING] = np.nan
+
+    sep_freq = None
+    if has_sep:
+        sep_freq = decode_numbers(buf, starts[:, n_date], ends[:, n_date]).astype(np.float32)
+    return times, values, sep_freq
+
+
+def parse_spectral(text):
+    # parses .data_spec/.swdir/.swdir2/.swr1/.swr2 (realtime2, "value (freq)" pairs) and the
+    # historical yearly files (frequencies in the header) straight into arrays
+    data = text.encode("ascii", errors="replace") if isinstance(text, str) else text
+
+    # header lines are the leading ones that don't start with a year
+    header = []
+    offset = 0
+    while offset < len(data) and not data[offset:offset + 1].isdigit():
+        line_end = data.find(b"\n", offset)
+        line_end = len(data) if line_end == -1 else line_end
+        header.append(data[offset:line_end].decode("ascii", errors="replace"))
+        offset = line_end + 1
+
+    line_end = data.find(b"\n", offset)
+    first_line = data[offset:len(data) if line_end == -1 else line_end].decode("ascii", errors="replace")
+    first = first_line.split()
+    if not first:
+        return empty_block()
+
+    realtime = "(" in first_line
+    head_tokens = header[0].lstrip("#").split() if header else []
+    if realtime:
+        n_date = 5
+        has_sep = any(tok.lower() == "sep_freq" for tok in head_tokens)
+    else:
+        n_date = 0
+        while n_date < len(head_tokens) and not is_number(head_tokens[n_date]):
+            n_date += 1
+        has_sep = False
+    first_value = n_date + (1 if has_sep else 0)
+    step = 2 if realtime else 1
+
+    # walk the body in line-aligned blocks so the temporaries stay a fixed size
+    buf = np.frombuffer(data, dtype=np.uint8)
+    pieces = []
+    lo = offset
+    while lo < len(data):
+        hi = data.find(b"\n", min(lo + BLOCK_BYTES, len(data)))
+        hi = len(data) if hi == -1 else hi + 1
+        pieces.append(parse_rows(buf[lo:hi], len(first), n_date, first_value, step, has_sep))
+        lo = hi
+
+    times = np.concatenate([p[0] for p in pieces])
+    values = np.concatenate([p[1] for p in pieces])
+    sep_freq = np.concatenate([p[2] for p in pieces]) if has_sep else None
+
+    if realtime:
+        freqs = np.array([float(tok.strip("()")) for tok in first[first_value + 1::2]])
+    else:
+        freqs = np.array([float(tok) for tok in head_tokens[n_date:]])
+
+    return SpectralBlock(times, freqs.astype(np.float32), values, sep_freq)
+
+
+def select_times(block, times):
+    # rows of block at the given times (all must be present), in the order of times
+    order = np.argsort(block.times, kind="stable")
+    rows = order[np.searchsorted(block.times, times, sorter=order)]
+    sep_freq = block.sep_freq[rows] if block.sep_freq is not None else None
+    return SpectralBlock(block.times[rows], block.freqs, block.values[rows], sep_freq)
+
+
+def select_freqs(block, freqs, tol=0.002):
+    # columns of block nearest each of freqs (realtime files round to 3 places, historical ones
+    # carry an extra 0.02 Hz bin), None if any of freqs has no bin within tol
+    if len(block.freqs) == 0:
+        return None
+    cols = np.abs(block.freqs[None, :] - np.asarray(freqs, dtype=np.float32)[:, None]).argmin(axis=1)
+    if np.any(np.abs(block.freqs[cols] - freqs) > tol):
+        return None
+    return SpectralBlock(block.times, block.freqs[cols], block.values[:, cols], block.sep_freq)
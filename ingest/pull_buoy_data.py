@@ -0,0 +1,170 @@
+import io
+import os
+import pandas as pd
+import math
+import numpy as np
+import psycopg2
+
+from fetch import fetch_stations, FILE_EXTS
+from spreading import compute_spreading, DIRECTIONS, DEFAULT_ESTIMATOR
+from bulk_load import load_time_steps, load_spectra, BATCH_SIZE
+from parse import parse_spectral, select_times, select_freqs
+from schema import migrate
+from stats import spectral_stats, stats_frame
+from incremental import load_ingest_state, save_ingest_state, new_rows, HEADER_LINES
+
+buoys = [46026, 41009]
+url = r'https://www.ndbc.noaa.gov/data/realtime2/'
+wpm_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'WPM_spectra.xlsx')
+
+# spectral files, parsed to arrays rather than DataFrames
+SPEC_EXTS = ['data_spec', 'swdir', 'swdir2', 'swr1', 'swr2']
+
+# directional estimator written to the spreading tables ('fourier', 'mem' or 'mlm', see spreading.ESTIMATORS)
+ESTIMATOR = os.environ.get('DIRSPEC_ESTIMATOR', DEFAULT_ESTIMATOR)
+
+def create_tables(conn):
+    # tables, indexes and summaries all come from the versioned migrations in schema.py
+    migrate(conn)
+
+def datetime_dfs(x,buoy_id):
+    new_columns = ['year','month','day','hour','minute']
+    x.rename(columns=dict(zip(x.columns[0:5], new_columns)),inplace=True)
+    x.insert(0,'datetime',pd.to_datetime(x[['year', 'month', 'day', 'hour', 'minute']],utc=True))
+    x.insert(0,'station_id',buoy_id)
+    x.drop(['year', 'month', 'day', 'hour', 'minute'], axis='columns',inplace=True)
+    return x
+
+def read_ndbc(text, **kwargs):
+    return pd.read_csv(io.StringIO(text), sep='\s+', na_values=["MM",'999.0'], **kwargs)
+
+def process_station(conn, buoy_id, df_txt, spec, batch_size=BATCH_SIZE, estimator=ESTIMATOR):
+    # df_txt has station_id/datetime columns, spec is {ext: SpectralBlock} for SPEC_EXTS.
+    # returns the timesteps that lined up across the files (now all in the db), oldest first
+    spec = {ext: select_freqs(block, freqs) for ext, block in spec.items()}
+    if any(block is None for block in spec.values()):
+        print(f"Skipping {buoy_id}: frequency bins don't match the WPM bins")
+        return pd.DatetimeIndex([], tz='UTC')
+
+    # keep only timesteps present in every file, oldest first
+    common = df_txt['datetime'].dt.tz_convert(None).to_numpy().astype('datetime64[m]')
+    for block in spec.values():
+        common = np.intersect1d(common, block.times)
+    if len(common) == 0:
+        return pd.DatetimeIndex([], tz='UTC')
+    spec = {ext: select_times(block, common) for ext, block in spec.items()}
+
+    times = pd.DatetimeIndex(common).tz_localize('UTC')
+    df_txt = df_txt.drop_duplicates('datetime').set_index('datetime').reindex(times)
+    df_txt = df_txt.rename_axis('datetime').reset_index()
+
+    # spectral and directional statistics for all timesteps in one array pass,
+    # the moments, Hm0, Te and P also go on the timestep output table df_txt
+    Ef = spec['data_spec'].values.astype(float)
+    stats = spectral_stats(freqs, bandwidths, Ef, spec['swdir'].values, spec['swr1'].values)
+    df_txt['m0'] = stats['m0']
+    df_txt['hm0'] = stats['hm0']
+    df_txt['m_1'] = stats['m_1']
+    df_txt['Te'] = stats['te']
+    df_txt['P'] = stats['p']
+
+    # convert the buoy ids to strings
+    df_txt['station_id'] = df_txt['station_id'].astype(str)
+
+    # write the new timesteps and resolve all of their ids for the rest of the batch
+    ts_lookup = load_time_steps(conn, df_txt)
+
+    # timesteps that still need spectra written, ids come from the in-memory lookup
+    keys = [(str(buoy_id), dt) for dt in df_txt['datetime']]
+    pending = np.array([k in ts_lookup and not ts_lookup[k][1] for k in keys], dtype=bool)
+    timestep_ids = [ts_lookup[k][0] for k, p in zip(keys, pending) if p]
+
+    # compute D for every pending timestep at once, only D is stored so S is never built
+    Ef = Ef[pending]
+    alpha1 = spec['swdir'].values[pending]
+    alpha2 = spec['swdir2'].values[pending]
+    r1 = spec['swr1'].values[pending]
+    r2 = spec['swr2'].values[pending]
+    D_normalized, _ = compute_spreading(alpha1, alpha2, r1, r2, Ef, estimator=estimator, with_S=False)
+
+    df_stats = stats_frame(timestep_ids, {k: v[pending] for k, v in stats.items()})
+
+    # write spectra in batches of timesteps, one transaction per batch
+    load_spectra(conn, timestep_ids, freqs, Ef, alpha1, alpha2, r1, r2, D_normalized, DIRECTIONS, batch_size,
+                 df_stats=df_stats, estimator=estimator)
+
+    return times
+
+def get_buoy_data(conn, stations=buoys, batch_size=BATCH_SIZE, incremental=False, estimator=ESTIMATOR):
+    # incremental mode skips stations whose files haven't changed since the last run
+    # and only parses rows newer than each station's high-water timestamp
+    state = load_ingest_state(conn, stations) if incremental else {}
+    validators = {station_id: vals for station_id, (_, vals) in state.items()}
+
+    # downloads run concurrently, each station is processed as soon as its six files are in
+    for buoy_id, files, new_validators in fetch_stations(stations, base_url=url, validators=validators):
+        if files is None:
+            print(f"Skipping {buoy_id}: unchanged since last run")
+            continue
+
+        missing = [ext for ext in FILE_EXTS if files.get(ext) is None]
+        if missing:
+            print(f"Skipping {buoy_id}: missing {', '.join(missing)}")
+            continue
+
+        # cut each file down to the rows above the watermark before parsing
+        high_water = state.get(buoy_id, (None, None))[0]
+        if high_water is not None:
+            files = {ext: new_rows(text, high_water, HEADER_LINES[ext]) for ext, text in files.items()}
+            if any(text is None for text in files.values()):
+                # validators aren't saved so the next run looks again once the lagging files catch up
+                print(f"Skipping {buoy_id}: no rows newer than {high_water}")
+                continue
+
+        # the .txt file keeps its named columns, spectral files go straight to arrays
+        df_txt = datetime_dfs(read_ndbc(files['txt'], skiprows=[1]), buoy_id)
+        try:
+            spec = {ext: parse_spectral(files[ext]) for ext in SPEC_EXTS}
+        except ValueError as e:
+            print(f"Skipping {buoy_id}: {e}")
+            continue
+
+        # newest row of each spectral file, the heads can be a row apart between files
+        heads = [pd.Timestamp(block.times.max(), tz='UTC') for block in spec.values() if len(block.times)]
+
+        written = process_station(conn, buoy_id, df_txt, spec, batch_size, estimator)
+        if len(written):
+            high_water = written.max()
+
+        # a spectral file ahead of the rest means rows were left behind, so force a full fetch next time
+        if high_water is None or any(head > high_water for head in heads):
+            new_validators = {}
+        save_ingest_state(conn, buoy_id, high_water, new_validators)
+
+def load_wpm_bins(path=wpm_path):
+    # wpm center frequencies and bin widths
+    wpm_data = pd.read_excel(path,header=None,skiprows=1)
+    return pd.Series(wpm_data.iloc[:,1]), pd.Series(wpm_data.iloc[:,2])
+
+def connect():
+    return psycopg2.connect(
+        dbname="postgres",
+        user="Jacob",
+        password="",
+        host="localhost",
+        port="5432"
+    )
+
+# pull in the wpm freqs and bin sizes
+center_freqs, bandwidths = load_wpm_bins()
+freqs = np.array(center_freqs)
+
+if __name__ == "__main__":
+    # run table setup function to ensure tables exist
+    conn = connect()
+    create_tables(conn)
+
+    # pull down and process the NOAA buoy data (only what is new since the last run)
+    get_buoy_data(conn, incremental=True)
+
+    conn.close()
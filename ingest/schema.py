@@ -0,0 +1,294 @@
+import argparse
+
+# ordered (version, description, statements). applied versions are recorded in dirspec.schema_version,
+# so only the new entries run against an existing database. never edit an applied entry, append a new one
+MIGRATIONS = [
+    (1, "base tables", [
+    "CREATE SCHEMA IF NOT EXISTS dirspec",
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.buoys (
+        id SERIAL PRIMARY KEY,
+        station_id TEXT UNIQUE NOT NULL,
+        name TEXT,
+        lat DOUBLE PRECISION,
+        lon DOUBLE PRECISION,
+        depth DOUBLE PRECISION
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.time_steps (
+        id SERIAL PRIMARY KEY,
+        buoy_id INTEGER REFERENCES dirspec.buoys(id),
+        timestamp TIMESTAMPTZ NOT NULL,
+
+        -- Observational metadata
+        WDIR INTEGER,                     -- Wind direction (degrees)
+        WSPD DOUBLE PRECISION,            -- Wind speed (m/s or knots)
+        GST  DOUBLE PRECISION,            -- Wind gust (m/s or knots)
+        WVHT DOUBLE PRECISION,            -- Significant wave height [m]
+        DPD  DOUBLE PRECISION,            -- Dominant period [s]
+        APD  DOUBLE PRECISION,            -- Average period [s]
+        MWD  DOUBLE PRECISION,            -- Mean wave direction (from) [deg]
+        PRES DOUBLE PRECISION,            -- Atmospheric pressure [hPa]
+        ATMP DOUBLE PRECISION,            -- Air temp [°C]
+        WTMP DOUBLE PRECISION,            -- Water temp [°C]
+        DEWP DOUBLE PRECISION,            -- Dew point [°C]
+        VIS  DOUBLE PRECISION,            -- Visibility [nmi]
+        PTDY DOUBLE PRECISION,            -- Pressure tendency [hPa]
+        TIDE DOUBLE PRECISION,            -- Tide level [ft or m]
+
+        -- Derived spectral parameters
+        m0   DOUBLE PRECISION,            -- Spectral moment 0
+        hm0  DOUBLE PRECISION,            -- Significant wave height from spectrum
+        m_1  DOUBLE PRECISION,            -- Spectral moment 1
+        Te   DOUBLE PRECISION,            -- Energy period
+        P    DOUBLE PRECISION,            -- Wave power [kW/m]
+
+        spectra_ingested BOOLEAN DEFAULT FALSE,
+
+    UNIQUE (buoy_id, timestamp)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.spectra_parameters (
+        time_step_id INTEGER REFERENCES dirspec.time_steps(id),
+        frequency DOUBLE PRECISION,
+        energy_density DOUBLE PRECISION,  -- Ef [m²/Hz]
+        alpha1 DOUBLE PRECISION,          -- Mean direction, first harmonic [deg]
+        alpha2 DOUBLE PRECISION,          -- Mean direction, second harmonic [deg]
+        r1 DOUBLE PRECISION,
+        r2 DOUBLE PRECISION,
+        PRIMARY KEY (time_step_id, frequency)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.spectra_directional (
+        time_step_id INTEGER REFERENCES dirspec.time_steps(id),
+        frequency DOUBLE PRECISION,
+        direction INTEGER,
+        spreading DOUBLE PRECISION,       -- Normalized D(f, θ)
+        PRIMARY KEY (time_step_id, frequency, direction)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.ingest_state (
+        station_id TEXT PRIMARY KEY,
+        high_water TIMESTAMPTZ,           -- Newest timestep with spectra written
+        validators JSONB,                 -- Per-file ETag / Last-Modified / sha1 from the last fetch
+        updated_at TIMESTAMPTZ DEFAULT now()
+    );
+    """,
+    ]),
+    (2, "packed one-row-per-timestep spreading layout", [
+    # compact layout, one row per timestep instead of one per (frequency, direction)
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.spectra_directional_packed (
+        time_step_id INTEGER PRIMARY KEY REFERENCES dirspec.time_steps(id),
+        frequencies REAL[] NOT NULL,      -- F bin centers [Hz]
+        directions REAL[] NOT NULL,       -- Θ directions [deg]
+        energy_density BYTEA NOT NULL,    -- Ef, F big-endian float4
+        spreading BYTEA NOT NULL          -- Normalized D(f, θ), F×Θ big-endian float4, frequency-major
+    );
+    """,
+    ]),
+    (3, "indexes for the viewer and ingest access paths", [
+    # the primary keys already cover (time_step_id, frequency[, direction]) lookups and
+    # UNIQUE (buoy_id, timestamp) covers the per-station timestep listing, newest first.
+    # this one serves the availability rebuild and listings of timesteps that have spectra
+    """
+    CREATE INDEX IF NOT EXISTS time_steps_buoy_ingested_idx
+    ON dirspec.time_steps (buoy_id, timestamp DESC)
+    WHERE spectra_ingested
+    """,
+    "ANALYZE dirspec.time_steps",
+    ]),
+    (4, "station availability summary", [
+    # one row per station with spectra, kept current by the ingester as timesteps are flagged
+    # (a postgres materialized view can only be refreshed in full)
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.station_availability (
+        buoy_id INTEGER PRIMARY KEY REFERENCES dirspec.buoys(id),
+        first_timestamp TIMESTAMPTZ,       -- Oldest timestep with spectra
+        last_timestamp TIMESTAMPTZ,        -- Newest timestep with spectra
+        n_timesteps INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT now()
+    )
+    """,
+    """
+    INSERT INTO dirspec.station_availability (buoy_id, first_timestamp, last_timestamp, n_timesteps)
+    SELECT buoy_id, min(timestamp), max(timestamp), count(*)
+    FROM dirspec.time_steps
+    WHERE spectra_ingested
+    GROUP BY buoy_id
+    ON CONFLICT (buoy_id) DO NOTHING
+    """,
+    ]),
+    (5, "latest sea state per station and a spatial index for the map", [
+    """
+    ALTER TABLE dirspec.station_availability
+        ADD COLUMN IF NOT EXISTS latest_hm0 REAL,     -- Hm0 of the newest timestep with spectra [m]
+        ADD COLUMN IF NOT EXISTS latest_p REAL        -- P of the newest timestep with spectra [kW/m]
+    """,
+    """
+    UPDATE dirspec.station_availability a
+    SET latest_hm0 = ts.hm0, latest_p = ts.p
+    FROM dirspec.time_steps ts
+    WHERE ts.buoy_id = a.buoy_id AND ts.timestamp = a.last_timestamp
+    """,
+    # built-in geometric types, so viewport lookups are a GiST box search without PostGIS
+    """
+    CREATE INDEX IF NOT EXISTS buoys_location_idx
+    ON dirspec.buoys USING gist (point(lon, lat))
+    """,
+    "ANALYZE dirspec.buoys",
+    ]),
+    (6, "station catalog attributes", [
+    # filled by catalog.py from activestations.xml. stations dropped from the catalog are kept
+    # (their history stays browsable) but marked inactive
+    """
+    ALTER TABLE dirspec.buoys
+        ADD COLUMN IF NOT EXISTS elev DOUBLE PRECISION,               -- Site elevation [m above MSL]
+        ADD COLUMN IF NOT EXISTS owner TEXT,
+        ADD COLUMN IF NOT EXISTS program TEXT,
+        ADD COLUMN IF NOT EXISTS station_type TEXT,                   -- buoy, fixed, dart, ...
+        ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT TRUE,
+        ADD COLUMN IF NOT EXISTS catalog_updated_at TIMESTAMPTZ       -- Last time the catalog changed this row
+    """,
+    ]),
+    (7, "per-timestep spectral statistics", [
+    # written by the ingester with each batch of spectra (stats.py), python stats.py fills older timesteps
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.spectral_stats (
+        time_step_id INTEGER PRIMARY KEY REFERENCES dirspec.time_steps(id),
+        m0 DOUBLE PRECISION,              -- Spectral moments [m², m²·Hz, m²·Hz², m²·s]
+        m1 DOUBLE PRECISION,
+        m2 DOUBLE PRECISION,
+        m_1 DOUBLE PRECISION,
+        hm0 DOUBLE PRECISION,             -- Significant wave height [m]
+        fp DOUBLE PRECISION,              -- Peak frequency [Hz]
+        tp DOUBLE PRECISION,              -- Peak period [s]
+        tm01 DOUBLE PRECISION,            -- Mean period m0/m1 [s]
+        tm02 DOUBLE PRECISION,            -- Zero-crossing period sqrt(m0/m2) [s]
+        te DOUBLE PRECISION,              -- Energy period m_1/m0 [s]
+        p DOUBLE PRECISION,               -- Wave power [kW/m]
+        peak_dir DOUBLE PRECISION,        -- Mean direction (from) at the peak [deg]
+        peak_spread DOUBLE PRECISION,     -- Directional spread at the peak [deg]
+        mean_dir DOUBLE PRECISION,        -- Energy weighted mean direction (from) [deg]
+        mean_spread DOUBLE PRECISION,     -- Energy weighted directional spread [deg]
+        hm0_swell DOUBLE PRECISION,       -- Hm0 below the swell split frequency [m]
+        hm0_windsea DOUBLE PRECISION,     -- Hm0 above it [m]
+        swell_fraction DOUBLE PRECISION   -- Share of m0 that is swell
+    )
+    """,
+    ]),
+    (8, "directional estimator of each packed spreading matrix", [
+    """
+    ALTER TABLE dirspec.spectra_directional_packed
+        ADD COLUMN IF NOT EXISTS estimator TEXT NOT NULL DEFAULT 'fourier'   -- spreading.ESTIMATORS key
+    """,
+    ]),
+    (9, "per-unit backfill progress", [
+    # one row per archive station-year backfill.py has started, a rerun skips the done ones
+    """
+    CREATE TABLE IF NOT EXISTS dirspec.backfill_units (
+        station_id TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        status TEXT NOT NULL,             -- running, done or failed
+        timesteps INTEGER,                -- Timesteps written by the last finished attempt
+        seconds DOUBLE PRECISION,         -- Wall time of the last finished attempt
+        error TEXT,                       -- Why the last attempt failed
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (station_id, year)
+    )
+    """,
+    ]),
+]
+
+# serializes migrations between ingesters starting at the same time
+MIGRATION_LOCK = 7462001
+
+
+def current_version(cur):
+    cur.execute("SELECT COALESCE(max(version), 0) FROM dirspec.schema_version")
+    return cur.fetchone()[0]
+
+
+def migrate(conn, target=None):
+    # brings the dirspec schema up to target (default: latest), each version in its own transaction
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+        try:
+            cur.execute("CREATE SCHEMA IF NOT EXISTS dirspec")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS dirspec.schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMPTZ DEFAULT now()
+                )
+            """)
+            conn.commit()
+
+            version = current_version(cur)
+            for number, description, statements in MIGRATIONS:
+                if number <= version or (target is not None and number > target):
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute("INSERT INTO dirspec.schema_version (version, description) VALUES (%s, %s)",
+                            (number, description))
+                conn.commit()
+                print(f"Applied schema version {number}: {description}")
+                version = number
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+            conn.commit()
+    return version
+
+
+def refresh_station_availability(conn):
+    # full rebuild, for repairs. normal ingests keep the table current incrementally
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO dirspec.station_availability
+                (buoy_id, first_timestamp, last_timestamp, n_timesteps, latest_hm0, latest_p, updated_at)
+            SELECT buoy_id, min(timestamp), max(timestamp), count(*),
+                   (array_agg(hm0 ORDER BY timestamp DESC))[1], (array_agg(p ORDER BY timestamp DESC))[1], now()
+            FROM dirspec.time_steps
+            WHERE spectra_ingested
+            GROUP BY buoy_id
+            ON CONFLICT (buoy_id) DO UPDATE
+            SET first_timestamp = EXCLUDED.first_timestamp,
+                last_timestamp = EXCLUDED.last_timestamp,
+                n_timesteps = EXCLUDED.n_timesteps,
+                latest_hm0 = EXCLUDED.latest_hm0,
+                latest_p = EXCLUDED.latest_p,
+                updated_at = now()
+        """)
+        cur.execute("""
+            DELETE FROM dirspec.station_availability a
+            WHERE NOT EXISTS (
+                SELECT 1 FROM dirspec.time_steps ts
+                WHERE ts.buoy_id = a.buoy_id AND ts.spectra_ingested
+            )
+        """)
+    conn.commit()
+
+
+if __name__ == "__main__":
+    import pull_buoy_data
+
+    parser = argparse.ArgumentParser(description="Apply pending dirspec schema migrations")
+    parser.add_argument("--target", type=int, help="stop at this version")
+    parser.add_argument("--refresh-availability", action="store_true", help="rebuild station_availability from time_steps")
+    args = parser.parse_args()
+
+    conn = pull_buoy_data.connect()
+    print(f"dirspec schema at version {migrate(conn, args.target)}")
+    if args.refresh_availability:
+        refresh_station_availability(conn)
+        print("Rebuilt station_availability")
+    conn.close()
@@ -0,0 +1,134 @@
+import numpy as np
+
+# 72 directional points for NOAA buoys
+DIRECTIONS = np.arange(0, 360, 5)
+
+# timesteps per chunk, caps the T×F×Θ temporaries at a few MB each
+CHUNK_SIZE = 128
+
+# estimator used when none is asked for
+DEFAULT_ESTIMATOR = 'fourier'
+
+# keeps |c1| below 1 and the MLM cross-spectral matrix positive definite
+EPS = 1e-6
+
+
+def met_to_math_dir(angle_deg):
+    return np.deg2rad((270 - angle_deg) % 360)
+
+
+# every estimator takes alpha1, alpha2 (meteorological degrees), r1, r2 as T×F arrays and returns an
+# unnormalized D as T×F×Θ over the math-convention directions. NaN bins give a NaN row of D
+
+def fourier_chunk(alpha1, alpha2, r1, r2, directions=DIRECTIONS):
+    # first two harmonics of the truncated Fourier series, broad and can go negative
+    theta = np.deg2rad(directions)
+
+    # NaN bins stay NaN through the conversion and the whole row of D comes out NaN
+    a1 = met_to_math_dir(alpha1)[..., None]
+    a2 = met_to_math_dir(alpha2)[..., None]
+
+    return (1 / (2 * np.pi)) * (
+        1
+        + 2 * r1[..., None] * np.cos(theta - a1)
+        + 2 * r2[..., None] * np.cos(2 * (theta - a2))
+    )
+
+
+def circular_coefficients(alpha1, alpha2, r1, r2):
+    # complex first and second circular moments c1 = a1 + i·b1, c2 = a2 + i·b2 (math convention)
+    c1 = np.minimum(r1, 1 - EPS) * np.exp(1j * met_to_math_dir(alpha1))
+    c2 = r2 * np.exp(2j * met_to_math_dir(alpha2))
+    return c1, c2
+
+
+def mem_chunk(alpha1, alpha2, r1, r2, directions=DIRECTIONS):
+    # maximum entropy method (Lygre & Krogstad 1986), closed form for the first four coefficients,
+    # so the whole T×F batch is a handful of complex array operations. never negative
+    theta = np.deg2rad(directions)
+    c1, c2 = circular_coefficients(alpha1, alpha2, r1, r2)
+
+    # NaN bins propagate quietly
+    with np.errstate(invalid='ignore', divide='ignore'):
+        phi1 = (c1 - c2 * np.conj(c1)) / (1 - np.abs(c1) ** 2)
+        phi2 = c2 - c1 * phi1
+        numerator = 1 - phi1 * np.conj(c1) - phi2 * np.conj(c2)
+
+        e1 = np.exp(-1j * theta)
+        denominator = np.abs(1 - phi1[..., None] * e1 - phi2[..., None] * e1 ** 2) ** 2
+        return (1 / (2 * np.pi)) * np.real(numerator)[..., None] / denominator
+
+
+def mlm_chunk(alpha1, alpha2, r1, r2, directions=DIRECTIONS):
+    # maximum likelihood method (Capon 1969) for a heave/pitch/roll buoy: D ∝ 1 / (hᵀ Φ⁻¹ h) with
+    # h = [1, cos θ, sin θ] and Φ the normalized cross-spectral matrix. one batched 3×3 inverse per bin
+    theta = np.deg2rad(directions)
+    c1, c2 = circular_coefficients(alpha1, alpha2, r1, r2)
+    a1, b1, a2, b2 = c1.real, c1.imag, c2.real, c2.imag
+    missing = ~np.isfinite(a1 + b1 + a2 + b2)
+
+    ones = np.ones_like(a1)
+    phi = np.stack([
+        np.stack([ones, a1, b1], axis=-1),
+        np.stack([a1, (1 + a2) / 2, b2 / 2], axis=-1),
+        np.stack([b1, b2 / 2, (1 - a2) / 2], axis=-1),
+    ], axis=-2)
+    phi[missing] = np.eye(3)
+
+    # noisy bins can give an indefinite Φ and a negative D, so eigenvalues are floored at EPS
+    # (the nearest positive definite matrix) and the inverse is built from the same decomposition
+    w, v = np.linalg.eigh(phi)
+    phi_inv = np.einsum('...ik,...k,...jk->...ij', v, 1 / np.maximum(w, EPS), v)
+
+    h = np.stack([np.ones_like(theta), np.cos(theta), np.sin(theta)])
+    D = 1 / np.einsum('iq,...ij,jq->...q', h, phi_inv, h)
+    D[missing] = np.nan
+    return D
+
+
+ESTIMATORS = {
+    'fourier': fourier_chunk,
+    'mem': mem_chunk,
+    'mlm': mlm_chunk,
+}
+
+
+def spreading_chunk(alpha1, alpha2, r1, r2, directions=DIRECTIONS, estimator=DEFAULT_ESTIMATOR):
+    # alpha1, alpha2 (meteorological degrees), r1, r2 are T×F, returns normalized D as T×F×Θ
+    delta_theta = np.deg2rad(directions[1] - directions[0])
+    D = ESTIMATORS[estimator](alpha1, alpha2, r1, r2, directions)
+
+    row_sums = np.sum(D, axis=-1, keepdims=True) * delta_theta
+    row_sums[row_sums == 0] = 1
+    return D / row_sums
+
+
+def iter_spreading(alpha1, alpha2, r1, r2, energy, directions=DIRECTIONS, chunk_size=CHUNK_SIZE,
+                   estimator=DEFAULT_ESTIMATOR, with_S=True):
+    # yields (start, D, S) for consecutive timestep chunks so callers can stream them out,
+    # S is None when with_S is False
+    for start in range(0, len(energy), chunk_size):
+        stop = start + chunk_size
+        D = spreading_chunk(alpha1[start:stop], alpha2[start:stop], r1[start:stop], r2[start:stop], directions,
+                            estimator)
+        S = D * energy[start:stop, :, None] if with_S else None
+        yield start, D, S
+
+
+def compute_spreading(alpha1, alpha2, r1, r2, energy, directions=DIRECTIONS, chunk_size=CHUNK_SIZE, dtype=np.float64,
+                      estimator=DEFAULT_ESTIMATOR, with_S=True):
+    # all inputs are T×F arrays, returns normalized D and S = D·E as T×F×Θ arrays.
+    # with_S=False skips the second T×F×Θ array for callers that only store D, S comes back None
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator {estimator!r}, expected one of {', '.join(ESTIMATORS)}")
+    alpha1, alpha2, r1, r2, energy = (np.asarray(x, dtype=float) for x in (alpha1, alpha2, r1, r2, energy))
+    shape = energy.shape + (len(directions),)
+    D_out = np.empty(shape, dtype=dtype)
+    S_out = np.empty(shape, dtype=dtype) if with_S else None
+
+    for start, D, S in iter_spreading(alpha1, alpha2, r1, r2, energy, directions, chunk_size, estimator, with_S):
+        D_out[start:start + len(D)] = D
+        if with_S:
+            S_out[start:start + len(S)] = S
+
+    return D_out, S_out
@@ -0,0 +1,161 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from bulk_load import insert_stats
+
+# frequency separating swell from wind sea [Hz], a fixed 10 s split
+SWELL_SPLIT_HZ = 0.1
+
+# seawater density [kg/m³] and gravity [m/s²] for wave power
+RHO = 1025
+G = 9.81
+
+# columns of dirspec.spectral_stats, in the order spectral_stats returns them
+STATS_COLUMNS = ['m0', 'm1', 'm2', 'm_1', 'hm0', 'fp', 'tp', 'tm01', 'tm02', 'te', 'p',
+                 'peak_dir', 'peak_spread', 'mean_dir', 'mean_spread',
+                 'hm0_swell', 'hm0_windsea', 'swell_fraction']
+
+# time_steps ids handled per transaction by backfill_stats
+WINDOW = 2000
+
+
+def circular_moments(weights, alpha1, r1):
+    # energy weighted first-harmonic coefficients (Kuik et al. 1988), returns (direction [deg], spread [deg])
+    # per timestep. alpha1 stays in the buoy's meteorological convention, so does the result
+    a = np.deg2rad(alpha1)
+    valid = np.isfinite(weights) & np.isfinite(a) & np.isfinite(r1)
+    w = np.where(valid, weights, 0)
+    total = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        a1 = (w * np.where(valid, r1 * np.cos(a), 0)).sum(axis=1) / total
+        b1 = (w * np.where(valid, r1 * np.sin(a), 0)).sum(axis=1) / total
+    direction = np.rad2deg(np.arctan2(b1, a1)) % 360
+    spread = np.rad2deg(np.sqrt(np.clip(2 * (1 - np.hypot(a1, b1)), 0, None)))
+    return direction, spread
+
+
+def spectral_stats(freqs, bandwidths, Ef, alpha1, r1):
+    # every parameter for T timesteps in one pass over the T×F arrays, returns {column: (T,) array}.
+    # m0, hm0, m_1, te and p match what time_steps has always stored (missing bins count as zero energy)
+    f = np.asarray(freqs, dtype=float)
+    df = np.asarray(bandwidths, dtype=float)
+    Ef = np.asarray(Ef, dtype=float)
+    alpha1, r1 = np.asarray(alpha1, dtype=float), np.asarray(r1, dtype=float)
+
+    E = Ef * df
+    m0 = np.nansum(E, axis=1)
+    m1 = np.nansum(E * f, axis=1)
+    m2 = np.nansum(E * f ** 2, axis=1)
+    m_1 = np.nansum(E / f, axis=1)
+    hm0 = 4 * np.sqrt(m0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        te = m_1 / m0
+        tm01 = m0 / m1
+        tm02 = np.sqrt(m0 / m2)
+
+    # peak bin, timesteps without any energy get NaN
+    has_energy = np.isfinite(Ef).any(axis=1) & (m0 > 0)
+    peak = np.argmax(np.where(np.isfinite(Ef), Ef, -np.inf), axis=1)
+    rows = np.arange(len(Ef))
+    fp = np.where(has_energy, f[peak], np.nan)
+    peak_dir = np.where(has_energy, alpha1[rows, peak], np.nan)
+    with np.errstate(invalid='ignore'):
+        peak_spread = np.where(has_energy, np.rad2deg(np.sqrt(np.clip(2 * (1 - r1[rows, peak]), 0, None))), np.nan)
+
+    mean_dir, mean_spread = circular_moments(E, alpha1, r1)
+
+    swell = f < SWELL_SPLIT_HZ
+    m0_swell = np.nansum(E[:, swell], axis=1)
+    m0_windsea = np.nansum(E[:, ~swell], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        swell_fraction = np.where(m0 > 0, m0_swell / m0, np.nan)
+
+    return {
+        'm0': m0,
+        'm1': m1,
+        'm2': m2,
+        'm_1': m_1,
+        'hm0': hm0,
+        'fp': fp,
+        'tp': 1 / fp,
+        'tm01': tm01,
+        'tm02': tm02,
+        'te': te,
+        'p': (RHO * G ** 2 * hm0 ** 2 * te) / (64 * np.pi * 1000),
+        'peak_dir': peak_dir,
+        'peak_spread': peak_spread,
+        'mean_dir': np.where(has_energy, mean_dir, np.nan),
+        'mean_spread': np.where(has_energy, mean_spread, np.nan),
+        'hm0_swell': 4 * np.sqrt(m0_swell),
+        'hm0_windsea': 4 * np.sqrt(m0_windsea),
+        'swell_fraction': swell_fraction,
+    }
+
+
+def stats_frame(timestep_ids, stats):
+    df = pd.DataFrame({'time_step_id': np.asarray(timestep_ids, dtype=np.int64)})
+    for c in STATS_COLUMNS:
+        df[c] = stats[c]
+    return df
+
+
+# every timestep with spectra but no stats row, one row of aligned arrays each
+MISSING_SQL = """
+    SELECT sp.time_step_id,
+           array_agg(sp.frequency ORDER BY sp.frequency),
+           array_agg(sp.energy_density ORDER BY sp.frequency),
+           array_agg(sp.alpha1 ORDER BY sp.frequency),
+           array_agg(sp.r1 ORDER BY sp.frequency)
+    FROM dirspec.spectra_parameters sp
+    WHERE sp.time_step_id >= %(lo)s AND sp.time_step_id < %(hi)s
+      AND NOT EXISTS (SELECT 1 FROM dirspec.spectral_stats st WHERE st.time_step_id = sp.time_step_id)
+    GROUP BY sp.time_step_id
+"""
+
+
+def backfill_stats(conn, freqs, bandwidths, window=WINDOW):
+    # fills spectral_stats for timesteps ingested before it existed, window by window. timesteps
+    # whose bins aren't the WPM bins are skipped. safe to rerun
+    freqs = np.asarray(freqs, dtype=float)
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(time_step_id), max(time_step_id) FROM dirspec.spectra_parameters")
+        first, last = cur.fetchone()
+    if first is None:
+        print("Nothing to compute, spectra_parameters is empty")
+        return 0
+
+    written = 0
+    start = time.perf_counter()
+    for lo in range(first, last + 1, window):
+        with conn.cursor() as cur:
+            cur.execute(MISSING_SQL, {'lo': lo, 'hi': lo + window})
+            rows = [r for r in cur.fetchall()
+                    if len(r[1]) == len(freqs) and np.allclose(np.asarray(r[1], dtype=float), freqs, atol=1e-4)]
+            if rows:
+                # NULLs come back as None, float arrays turn them into NaN
+                Ef, alpha1, r1 = (np.array([r[i] for r in rows], dtype=float) for i in range(2, 5))
+                stats = spectral_stats(freqs, bandwidths, Ef, alpha1, r1)
+                df = stats_frame([r[0] for r in rows], stats)
+                written += insert_stats(cur, df)
+        conn.commit()
+        print(f"Stats through time_step_id {min(lo + window, last + 1) - 1}/{last} ({written} timesteps)")
+
+    elapsed = time.perf_counter() - start
+    print(f"Computed stats for {written} timesteps in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} timesteps/s)")
+    return written
+
+
+if __name__ == "__main__":
+    import pull_buoy_data
+
+    parser = argparse.ArgumentParser(description="Fill dirspec.spectral_stats for timesteps ingested before it existed")
+    parser.add_argument("--window", type=int, default=WINDOW, help="time_step ids per transaction")
+    args = parser.parse_args()
+
+    conn = pull_buoy_data.connect()
+    pull_buoy_data.create_tables(conn)
+    backfill_stats(conn, pull_buoy_data.freqs, pull_buoy_data.bandwidths, args.window)
+    conn.close()
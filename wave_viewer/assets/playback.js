@@ -0,0 +1,25 @@
+// achieved playback rate: a rolling window of the times spectrum frames were drawn
+
+var FPS_WINDOW = 10;
+var frameTimes = [];
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    playback: {
+        fps: function(figure, paused, target) {
+            if (paused) {
+                frameTimes = [];
+                return window.dash_clientside.no_update;
+            }
+            frameTimes.push(performance.now());
+            if (frameTimes.length > FPS_WINDOW) {
+                frameTimes.shift();
+            }
+            if (frameTimes.length < 2) {
+                return "";
+            }
+            var elapsed = (frameTimes[frameTimes.length - 1] - frameTimes[0]) / 1000;
+            var fps = (frameTimes.length - 1) / elapsed;
+            return fps.toFixed(1) + " fps (target " + target + ")";
+        }
+    }
+});
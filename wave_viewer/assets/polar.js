@@ -0,0 +1,49 @@
+// browser-side polar plot, redraws from the timestep's spreading matrix in stored-spreading
+// so a frequency click never goes back to the server
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    polar: {
+        render: function(clickData, store, template) {
+            // handle nonclicks and no timesteps available
+            if (!clickData || !store) {
+                return [template.empty, null];
+            }
+            var freq = clickData.points[0].x;
+
+            // nearest stored frequency bin to the click
+            var best = -1;
+            var bestDist = Infinity;
+            for (var i = 0; i < store.frequencies.length; i++) {
+                var dist = Math.abs(store.frequencies[i] - freq);
+                if (dist < bestDist) {
+                    best = i;
+                    bestDist = dist;
+                }
+            }
+            if (best < 0 || bestDist > template.freq_tol) {
+                return [{}, null];
+            }
+
+            var row = store.D[best];
+            // sized from D itself like build_polar_plot, MEM and MLM peaks are too narrow to smooth
+            var finite = row.filter(function(v) { return v !== null && !isNaN(v); });
+            var radialLimit = finite.length ? Math.max.apply(null, finite) * 1.1 : null;
+
+            var layout = JSON.parse(JSON.stringify(template.layout));
+            layout.title = {text: "Directional Spreading for f = " + freq.toFixed(3) + " Hz"};
+            layout.polar.radialaxis.range = [0, radialLimit];
+
+            return [{
+                data: [{
+                    type: "scatterpolar",
+                    r: row,
+                    theta: store.directions,
+                    mode: "lines",
+                    line: {color: "royalblue", width: 2},
+                    name: "S(f=" + freq.toFixed(3) + ")"
+                }],
+                layout: layout
+            }, freq];
+        }
+    }
+});
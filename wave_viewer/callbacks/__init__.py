@@ -1,6 +1,8 @@
 from .map_callbacks import register_map_callbacks
 from .plot_callbacks import register_plot_callbacks
+from .playback_callbacks import register_playback_callbacks
 
 def register_callbacks(app):
     register_map_callbacks(app)
     register_plot_callbacks(app)
+    register_playback_callbacks(app)
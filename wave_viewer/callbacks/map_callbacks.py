@@ -1,29 +1,112 @@
-import pandas as pd
-from dash import Input, Output
-from components.plots import build_spectrum_plot, build_polar_plot
-from sqlalchemy import create_engine, text
-from data.query import get_ts_data
+from datetime import date, timedelta
+from dash import Input, Output, State, Patch, ctx, no_update
+from data.query import get_timestep_page, get_station_range, PAGE_SIZE
+from components.map.map_fig import viewport_from_relayout, covers, fetch_region, region_clusters, map_patch, INITIAL_ZOOM
+
+# zoom levels a click on a cluster jumps in by
+CLUSTER_ZOOM_STEP = 2
+
+def timestep_option(row):
+    return {"label": str(row[1].strftime("%Y-%m-%d %H:%M UTC")), "value": row[0]}
+
+def page_cursor(page):
+    # timestamp to ask for the next older page with, None once the station's history is exhausted
+    if len(page) < PAGE_SIZE:
+        return None
+    return page[-1][1].isoformat()
 
 # create the dropdown for timestep selection and store selected buoy
 def register_map_callbacks(app):
+    # the dropdown holds one page of timesteps at a time: the newest on a buoy click, the page
+    # ending on a picked date for a jump, and "load older" appends the next page below the last
     @app.callback(
         Output("timestep-dropdown", "options"),
         Output("timestep-dropdown", "value"),
         Output("stored-buoy", "data"),
-        Input("buoy-map", "clickData")
+        Output("timestep-cursor", "data"),
+        Output("load-older-timesteps", "disabled"),
+        Output("timestep-jump", "min_date_allowed"),
+        Output("timestep-jump", "max_date_allowed"),
+        Input("buoy-map", "clickData"),
+        Input("load-older-timesteps", "n_clicks"),
+        Input("timestep-jump", "date"),
+        State("stored-buoy", "data"),
+        State("timestep-cursor", "data"),
     )
-    def update_timestep_dropdown(clickData):
+    def update_timestep_dropdown(clickData, n_clicks, jump_date, station_id, cursor):
+        if ctx.triggered_id == "load-older-timesteps":
+            if not station_id or not cursor:
+                return (no_update,) * 7
+            page = get_timestep_page(station_id, cursor)
+            options = Patch()
+            options.extend([timestep_option(row) for row in page])
+            next_cursor = page_cursor(page)
+            return options, no_update, no_update, next_cursor, next_cursor is None, no_update, no_update
+
+        if ctx.triggered_id == "timestep-jump":
+            if not station_id or not jump_date:
+                return (no_update,) * 7
+            # everything up to the end of the picked day (UTC), with the offset spelled out so the
+            # session timezone can't shift it
+            before = f"{date.fromisoformat(jump_date[:10]) + timedelta(days=1)}T00:00:00+00:00"
+            page = get_timestep_page(station_id, before)
+            options = [timestep_option(row) for row in page]
+            next_cursor = page_cursor(page)
+            default_value = options[0]["value"] if options else None
+            return options, default_value, no_update, next_cursor, next_cursor is None, no_update, no_update
+
         if not clickData:
-            return {}, None, None
-        
-        station_id = clickData["points"][0]["customdata"][0]
+            return [], None, None, None, True, None, None
 
-        results = get_ts_data(station_id)
-        #sta_id_label = f"Selected station: {station_id}"
+        station_id = clickData["points"][0]["customdata"][0]
+        # clusters have no station, clicking one zooms the map instead
+        if station_id is None:
+            return (no_update,) * 7
 
-        options = [{"label": str(row[1].strftime("%Y-%m-%d %H:%M UTC")), "value": row[0]} for row in results]
+        page = get_timestep_page(station_id)
+        options = [timestep_option(row) for row in page]
         default_value = options[0]["value"] if options else None
-        return options, default_value, station_id
+        next_cursor = page_cursor(page)
+
+        # bounds for the date picker, from the availability summary
+        available = get_station_range(station_id)
+        first, last = (available[0].date(), available[1].date()) if available else (None, None)
+        return options, default_value, station_id, next_cursor, next_cursor is None, first, last
+
+    # stations for the current viewport, clustered server-side. pans and zooms that stay inside
+    # the last fetched region at the same zoom level send nothing, otherwise only the trace
+    # arrays are patched
+    @app.callback(
+        Output("buoy-map", "figure", allow_duplicate=True),
+        Output("map-region", "data"),
+        Input("buoy-map", "relayoutData"),
+        State("map-region", "data"),
+        prevent_initial_call=True
+    )
+    def update_map_viewport(relayout, region):
+        view = viewport_from_relayout(relayout)
+        if view is None or covers(region, view):
+            return no_update, no_update
+        region = fetch_region(view)
+        return map_patch(Patch(), region_clusters(region)), region
+
+    @app.callback(
+        Output("buoy-map", "figure", allow_duplicate=True),
+        Input("buoy-map", "clickData"),
+        State("map-region", "data"),
+        prevent_initial_call=True
+    )
+    def zoom_to_cluster(clickData, region):
+        if not clickData or clickData["points"][0]["customdata"][0] is not None:
+            return no_update
+        point = clickData["points"][0]
+        zoom = (region["zoom"] if region else INITIAL_ZOOM) + CLUSTER_ZOOM_STEP
+        fig = Patch()
+        fig["layout"]["map"]["center"] = {"lat": point["lat"], "lon": point["lon"]}
+        fig["layout"]["map"]["zoom"] = zoom
+        # a new uirevision so plotly applies the zoom over the user's current view
+        fig["layout"]["uirevision"] = f"cluster-{point['lat']:.4f}-{point['lon']:.4f}-{zoom}"
+        return fig
 
     # this is to store the selected timestep into stored-timestep for grabbing spec data
     @app.callback(
@@ -31,4 +114,4 @@ def register_map_callbacks(app):
         Input("timestep-dropdown", "value")
     )
     def store_selected_timestep(timestep_id):
-        return timestep_id
\ No newline at end of file
+        return timestep_id
@@ -0,0 +1,100 @@
+from dash import Input, Output, State, ClientsideFunction, Patch, ctx, no_update
+
+from callbacks.map_callbacks import timestep_option
+from callbacks.plot_callbacks import prefetch_frames
+from data.query import get_timestamp, get_timestep_page_after, PAGE_SIZE
+
+# frames per second offered in the speed dropdown
+PLAYBACK_SPEEDS = [1, 2, 4, 8]
+DEFAULT_SPEED = 2
+
+# timesteps rendered ahead of the one on screen
+PREFETCH_AHEAD = 8
+
+def register_playback_callbacks(app):
+    # play/pause steps the dropdown forward in time from the selected timestep. the dropdown only
+    # holds a page or two, so newer pages are fetched as playback nears the newest loaded frame and
+    # it runs on to the end of the station's history. a new buoy stops playback
+    @app.callback(
+        Output("playback-interval", "disabled"),
+        Output("playback-state", "data"),
+        Output("playback-toggle", "children"),
+        Input("playback-toggle", "n_clicks"),
+        Input("stored-buoy", "data"),
+        State("playback-interval", "disabled"),
+        State("timestep-dropdown", "options"),
+        State("timestep-dropdown", "value"),
+        State("stored-freq", "data"),
+        State("estimator-select", "value"),
+        prevent_initial_call=True
+    )
+    def toggle_playback(n_clicks, station_id, paused, options, timestep_id, selected_freq, estimator):
+        if ctx.triggered_id != "playback-toggle" or not paused or not options:
+            return True, None, "Play"
+
+        # options are newest first, playback runs oldest to newest
+        frames = [option["value"] for option in options][::-1]
+        index = frames.index(timestep_id) if timestep_id in frames else 0
+        # from the newest the station has there's nothing left to play, start over from the oldest.
+        # the page asked for here is the one advance_playback would fetch next, so it stays cached
+        if index == len(frames) - 1 and not get_timestep_page_after(station_id, get_timestamp(frames[-1]).isoformat()):
+            index = 0
+        prefetch_frames(frames[index:index + PREFETCH_AHEAD + 1], selected_freq, estimator)
+        return False, {"frames": frames, "index": index, "station_id": station_id, "more": True}, "Pause"
+
+    @app.callback(
+        Output("timestep-dropdown", "value", allow_duplicate=True),
+        Output("timestep-dropdown", "options", allow_duplicate=True),
+        Output("playback-state", "data", allow_duplicate=True),
+        Output("playback-interval", "disabled", allow_duplicate=True),
+        Output("playback-toggle", "children", allow_duplicate=True),
+        Input("playback-interval", "n_intervals"),
+        State("playback-state", "data"),
+        State("stored-freq", "data"),
+        State("estimator-select", "value"),
+        prevent_initial_call=True
+    )
+    def advance_playback(n_intervals, state, selected_freq, estimator):
+        if not state:
+            return no_update, no_update, no_update, True, "Play"
+
+        # frames already shown are dropped so the state sent each tick stays about a page long
+        frames, index = state["frames"][state["index"] + 1:], 0
+        more = state.get("more", False)
+
+        # the next page of newer timesteps once the prefetch window reaches the end of what's loaded,
+        # also added to the top of the dropdown so the frame on screen is one of its options
+        options = no_update
+        if more and len(frames) <= PREFETCH_AHEAD + 1:
+            last = frames[-1] if frames else state["frames"][-1]
+            page = get_timestep_page_after(state["station_id"], get_timestamp(last).isoformat())
+            more = len(page) == PAGE_SIZE
+            if page:
+                frames = frames + [row[0] for row in page]
+                options = Patch()
+                for row in page:
+                    options.prepend(timestep_option(row))
+
+        if not frames:
+            return no_update, options, None, True, "Play"
+
+        # keep the next frames rendering while this one is shown
+        prefetch_frames(frames[1:PREFETCH_AHEAD + 1], selected_freq, estimator)
+        return frames[0], options, {"frames": frames, "index": 0, "station_id": state["station_id"], "more": more}, \
+            no_update, no_update
+
+    @app.callback(
+        Output("playback-interval", "interval"),
+        Input("playback-speed", "value")
+    )
+    def set_playback_speed(fps):
+        return int(1000 / (fps or DEFAULT_SPEED))
+
+    # frames per second actually drawn, measured in the browser as spectrum figures arrive
+    app.clientside_callback(
+        ClientsideFunction(namespace="playback", function_name="fps"),
+        Output("playback-fps", "children"),
+        Input("spectrum-plot", "figure"),
+        State("playback-interval", "disabled"),
+        State("playback-speed", "value"),
+    )
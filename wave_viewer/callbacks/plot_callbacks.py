@@ -1,56 +1,108 @@
-from dash import Input, Output
+from dash import Input, Output, State, ClientsideFunction, Patch
 import numpy as np
 
 # queries
 import data.query as dq
+from data import prefetch
+from data.reconstruct import reconstruct_frequency, reconstruct_timestep, DEFAULT_ESTIMATOR
 
 # components
 from components.sidebar.build_sidebar  import build_sidebar
-from components.plots.build_spectrum_plot import build_spec_plot
+from components.plots.build_spectrum_plot import build_spec_plot, marker_shape
 from components.plots.build_polar_plot import build_polar_plot
 from components.empty_figs import empty_fig, empty_fig_spec
 
+# "reconstruct" rebuilds D(θ) from the spectra_parameters coefficients with the estimator picked in the
+# page, "stored" reads the spreading tables (whatever estimator the ingester ran)
+POLAR_SOURCE = "reconstruct"
+
+# "clientside" ships the whole F×Θ matrix once per timestep and draws frequency clicks in the
+# browser (assets/polar.js), "server" builds the polar figure in python on every click
+POLAR_MODE = "clientside"
+
+# decimals kept for D in the store, plenty for plotting and keeps the payload ~30 KB
+STORE_DECIMALS = 6
+
+def spectrum_outputs(timestep_id, selected_freq):
+    # (spectrum figure, sidebar) for one timestep, what update_spectrum_plot sends back
+    # spectrum, timestep parameters and station metadata in one round-trip
+    bundle = dq.get_timestep_bundle(timestep_id) if timestep_id is not None else None
+
+    if bundle is not None:
+        # build the data that goes to the sidebar
+        sidebar_out = build_sidebar(bundle["params"], bundle["station"], bundle["stats"])
+
+        fig = build_spec_plot(bundle["spectrum"],selected_freq)
+
+        return fig, sidebar_out
+    else:
+        return empty_fig, None
+
+def spreading_store(timestep_id, estimator=DEFAULT_ESTIMATOR):
+    # stored-spreading payload for one timestep
+    if timestep_id is None:
+        return None
+
+    if POLAR_SOURCE == "reconstruct":
+        matrix = reconstruct_timestep(timestep_id, estimator or DEFAULT_ESTIMATOR)
+    else:
+        matrix = dq.get_spreading_matrix(timestep_id)
+    if matrix is None:
+        return None
+
+    freqs, directions, _, D = matrix
+    D = np.round(D, STORE_DECIMALS)
+    return {
+        "timestep_id": timestep_id,
+        "frequencies": freqs.tolist(),
+        "directions": directions.tolist(),
+        # NaN isn't valid JSON, missing bins go over as null
+        "D": np.where(np.isnan(D), None, D).tolist(),
+    }
+
+def prefetch_frames(timestep_ids, selected_freq, estimator=DEFAULT_ESTIMATOR):
+    # renders these timesteps in the background so playback finds them ready
+    for timestep_id in timestep_ids:
+        prefetch.submit(("spectrum", timestep_id, selected_freq), spectrum_outputs, timestep_id, selected_freq)
+        if POLAR_MODE == "clientside":
+            prefetch.submit(("spreading", timestep_id, estimator), spreading_store, timestep_id, estimator)
+
 def register_plot_callbacks(app):
     @app.callback(
     Output("spectrum-plot", "figure"),
     Output("station-info", "children"),
     Input("stored-timestep", "data"),
     Input("stored-buoy", "data"),
-    Input("stored-freq", "data"),
+    State("stored-freq", "data"),
     prevent_initial_call=True)
     
     def update_spectrum_plot(timestep_id, selected_buoy, selected_freq):
-        station_id = selected_buoy
-
-        # get spectrum for selected time_step
-        df = dq.get_spectrum_for_timestep(timestep_id)
-
-        # get station parameters for selected timestep
-        df_ts_param = dq.get_param_for_timestep(timestep_id)
-
-        # get the station name for the sidebar
-        station_name = dq.get_station_name(station_id)
+        # already rendered if playback prefetched it
+        return prefetch.take(("spectrum", timestep_id, selected_freq), spectrum_outputs, timestep_id, selected_freq)
 
-        # fetch timestamp for plot titles
-        if df.empty == False:
-            #timestamp = dq.get_timestamp(timestep_id)
-            
-            # build the data that goes to the sidebar
-            sidebar_out = build_sidebar(df_ts_param,station_id,station_name)
-
-            fig = build_spec_plot(df,selected_freq)
+    # a frequency click only moves the marker, so only the shape goes over the wire
+    @app.callback(
+    Output("spectrum-plot", "figure", allow_duplicate=True),
+    Input("stored-freq", "data"),
+    prevent_initial_call=True)
 
-            return fig, sidebar_out
-        else:
-            return empty_fig, None
+    def update_freq_marker(selected_freq):
+        patched = Patch()
+        patched["layout"]["shapes"] = [marker_shape(selected_freq)] if selected_freq else []
+        return patched
         
+    if POLAR_MODE == "clientside":
+        register_clientside_polar(app)
+        return
+
     @app.callback(
     Output("polar-plot","figure"),
     Output("stored-freq", "data"),
     Input("spectrum-plot","clickData"),
-    Input("stored-timestep", "data")
+    Input("stored-timestep", "data"),
+    Input("estimator-select", "value")
     )
-    def update_polar_plot(clickData, timestep_id):
+    def update_polar_plot(clickData, timestep_id, estimator):
         # handle nonclicks and no timesteps available
         if not clickData or timestep_id is None:
             return empty_fig_spec, None
@@ -58,8 +110,11 @@ def register_plot_callbacks(app):
         # extract frequency bin from click
         freq_bin = clickData["points"][0]["x"]
 
-        # pull spectral data from postgres
-        df = dq.get_spectral_data(timestep_id,freq_bin)
+        # spreading for the clicked bin, rebuilt from the coefficients or pulled from postgres
+        if POLAR_SOURCE == "reconstruct":
+            df = reconstruct_frequency(timestep_id,freq_bin,estimator or DEFAULT_ESTIMATOR)
+        else:
+            df = dq.get_spectral_data(timestep_id,freq_bin)
 
         # handle no return from postgres
         if df.empty:
@@ -68,5 +123,22 @@ def register_plot_callbacks(app):
         fig = build_polar_plot(df,freq_bin)
 
         return fig, freq_bin
-    
-        
\ No newline at end of file
+
+def register_clientside_polar(app):
+    # one server hop per timestep to fill the store, none per frequency click
+    @app.callback(
+    Output("stored-spreading", "data"),
+    Input("stored-timestep", "data"),
+    Input("estimator-select", "value")
+    )
+    def store_spreading(timestep_id, estimator):
+        return prefetch.take(("spreading", timestep_id, estimator), spreading_store, timestep_id, estimator)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace="polar", function_name="render"),
+        Output("polar-plot", "figure"),
+        Output("stored-freq", "data"),
+        Input("spectrum-plot", "clickData"),
+        Input("stored-spreading", "data"),
+        State("polar-template", "data"),
+    )
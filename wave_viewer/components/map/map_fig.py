@@ -1,25 +1,226 @@
-import plotly.express as px
-from data.query import get_buoy_locations
-
-buoy_df = get_buoy_locations()
-
-fig = px.scatter_map(
-    buoy_df,
-    lat="lat",
-    lon="lon",
-    hover_name="name",
-    hover_data=["station_id"],
-    zoom=2,
-    height=50,
-    map_style="carto-positron",
-)
-
-# Set the map style and access token
-fig.update_layout(
-                margin=dict(l=0, r= 0, t=0, b=0),
-                mapbox_style = "open-street-map",
-                mapbox_zoom = 2,
-                mapbox_center = {"lat": 30, "lon": -70},
-                autosize = True,
-                uirevision = 'constant')
-fig.update_traces(marker=dict(size=12, color="royalblue"))
\ No newline at end of file
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+import data.query as dq
+
+# last built map, read on boot so workers start without touching the db
+SNAPSHOT_PATH = os.environ.get("DIRSPEC_MAP_SNAPSHOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "map_snapshot.json"))
+
+# seconds between checks for a changed buoy set
+REFRESH_SECONDS = 300
+
+# view the map opens on
+INITIAL_CENTER = {"lat": 30, "lon": -70}
+INITIAL_ZOOM = 2
+
+# stations closer than this on screen are drawn as one cluster (256 px tiles)
+CLUSTER_PX = 40
+
+# fraction of the viewport fetched beyond each edge, panning inside it needs no new query
+VIEW_PADDING = 0.5
+
+# colour scale bounds for latest hm0 [m]
+HM0_RANGE = (0, 8)
+
+# the two traces: stations/clusters with spectra coloured by hm0, and the rest in grey
+DATA_TRACE, NO_DATA_TRACE = 0, 1
+
+_fig = None
+_signature = None
+_lock = threading.Lock()
+_refresher_pid = None
+
+def cluster_cell(zoom):
+    # grid cell in degrees, fixed within a zoom level so cells don't reshuffle while zooming
+    return 360 / 2 ** math.floor(zoom) * CLUSTER_PX / 256
+
+def viewport_from_relayout(relayout):
+    # (west, south, east, north, zoom) from a map relayoutData, None if it isn't a pan or zoom.
+    # longitudes are left unwrapped (they can run past ±180) so boxes compare while panning
+    if not relayout:
+        return None
+    for prefix in ("map", "mapbox"):
+        derived = relayout.get(f"{prefix}._derived")
+        if derived and "coordinates" in derived:
+            lons = [c[0] for c in derived["coordinates"]]
+            lats = [c[1] for c in derived["coordinates"]]
+            zoom = relayout.get(f"{prefix}.zoom", INITIAL_ZOOM)
+            return min(lons), min(lats), max(lons), max(lats), zoom
+    return None
+
+def fetch_region(view):
+    # the viewport padded by VIEW_PADDING and snapped to the cluster grid, so nearby views share
+    # the same region (and cache entry)
+    west, south, east, north, zoom = view
+    cell = cluster_cell(zoom)
+    pad_lon = (east - west) * VIEW_PADDING
+    pad_lat = (north - south) * VIEW_PADDING
+    return {
+        "west": math.floor((west - pad_lon) / cell) * cell,
+        "south": max(math.floor((south - pad_lat) / cell) * cell, -90),
+        "east": math.ceil((east + pad_lon) / cell) * cell,
+        "north": min(math.ceil((north + pad_lat) / cell) * cell, 90),
+        "cell": cell,
+        "zoom": math.floor(zoom),
+    }
+
+def covers(region, view):
+    # True when region was fetched at view's zoom level and contains all of it
+    if not region:
+        return False
+    west, south, east, north, zoom = view
+    return (region["zoom"] == math.floor(zoom) and region["west"] <= west and east <= region["east"]
+            and region["south"] <= south and north <= region["north"])
+
+def wrap_lon(lon):
+    return (lon + 180) % 360 - 180
+
+def region_clusters(region):
+    if region["east"] - region["west"] >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west, east = wrap_lon(region["west"]), wrap_lon(region["east"])
+    return dq.get_station_clusters(float(west), float(region["south"]), float(east), float(region["north"]),
+                                   float(region["cell"]))
+
+def initial_region():
+    return {"west": -180.0, "south": -90.0, "east": 180.0, "north": 90.0,
+            "cell": cluster_cell(INITIAL_ZOOM), "zoom": INITIAL_ZOOM}
+
+def hover_text(row):
+    if row.n > 1:
+        text = f"{row.n} stations ({row.n_with_data} with spectra)<br>Click to zoom in"
+        return text if row.n_with_data == 0 else f"{text}<br>Highest Hm0 {row.hm0:.2f} m, P {row.p:.1f} kW/m"
+    text = f"{row.station_id}: {row.name}"
+    return f"{text}<br>No spectra yet" if row.n_with_data == 0 else f"{text}<br>Hm0 {row.hm0:.2f} m, P {row.p:.1f} kW/m"
+
+def trace_data(clusters):
+    # per-trace arrays for the two map traces, singles carry their station_id for the click callbacks
+    traces = []
+    for with_data in (True, False):
+        df = clusters[(clusters["n_with_data"] > 0) == with_data]
+        traces.append({
+            "lat": df["lat"].tolist(),
+            "lon": df["lon"].tolist(),
+            "customdata": [[row.station_id if row.n == 1 else None, int(row.n)] for row in df.itertuples()],
+            "hovertext": [hover_text(row) for row in df.itertuples()],
+            "marker_size": (10 + 4 * np.log2(df["n"].to_numpy(dtype=float))).tolist(),
+            "marker_color": df["hm0"].fillna(0).tolist() if with_data else "lightgray",
+        })
+    return traces
+
+def build_map_fig(clusters):
+    fig = go.Figure()
+    for trace in trace_data(clusters):
+        fig.add_trace(go.Scattermap(
+            lat=trace["lat"],
+            lon=trace["lon"],
+            customdata=trace["customdata"],
+            hovertext=trace["hovertext"],
+            hovertemplate="%{hovertext}<extra></extra>",
+            marker=dict(size=trace["marker_size"], color=trace["marker_color"]),
+            showlegend=False,
+        ))
+    fig.update_traces(selector=DATA_TRACE, marker=dict(colorscale="Viridis", cmin=HM0_RANGE[0], cmax=HM0_RANGE[1],
+                                                       colorbar=dict(title="Hm0 (m)", thickness=10)))
+
+    # Set the map style and starting view
+    fig.update_layout(
+                    margin=dict(l=0, r= 0, t=0, b=0),
+                    map_style = "carto-positron",
+                    map_zoom = INITIAL_ZOOM,
+                    map_center = INITIAL_CENTER,
+                    autosize = True,
+                    uirevision = 'constant')
+    return fig
+
+def map_patch(fig_patch, clusters):
+    # only the trace arrays go back to the browser when the viewport moves
+    for i, trace in enumerate(trace_data(clusters)):
+        fig_patch["data"][i]["lat"] = trace["lat"]
+        fig_patch["data"][i]["lon"] = trace["lon"]
+        fig_patch["data"][i]["customdata"] = trace["customdata"]
+        fig_patch["data"][i]["hovertext"] = trace["hovertext"]
+        fig_patch["data"][i]["marker"]["size"] = trace["marker_size"]
+        fig_patch["data"][i]["marker"]["color"] = trace["marker_color"]
+    return fig_patch
+
+def clusters_signature(clusters):
+    # changes whenever a station is added, dropped, renamed, moved or gets new spectra
+    rows = clusters.sort_values(["lat", "lon"]).to_csv(index=False)
+    return hashlib.sha1(rows.encode()).hexdigest()
+
+def load_snapshot():
+    try:
+        with open(SNAPSHOT_PATH) as f:
+            payload = json.load(f)
+        fig = go.Figure(payload["figure"])
+        # snapshots from before the two-trace cluster layout can't take trace patches
+        if len(fig.data) != 2:
+            raise ValueError("not a clustered map")
+        return fig, payload["signature"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"No usable map snapshot at {SNAPSHOT_PATH}: {e}")
+        return None, None
+
+def save_snapshot(fig, signature):
+    # write then rename so a worker booting mid-write never reads half a file
+    tmp = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            f.write('{"signature": ' + json.dumps(signature) + ', "figure": ' + fig.to_json() + '}')
+        os.replace(tmp, SNAPSHOT_PATH)
+    except OSError as e:
+        print(f"Could not write map snapshot: {e}")
+
+def refresh_map():
+    # rebuilds the opening view only if its clusters changed, returns True when they did
+    global _fig, _signature
+    clusters = region_clusters(initial_region())
+    signature = clusters_signature(clusters)
+    if signature == _signature:
+        return False
+    fig = build_map_fig(clusters)
+    with _lock:
+        _fig, _signature = fig, signature
+    save_snapshot(fig, signature)
+    return True
+
+def refresh_loop():
+    while True:
+        try:
+            refresh_map()
+        except Exception as e:
+            print(f"Map refresh failed: {e}")
+        time.sleep(REFRESH_SECONDS)
+
+def ensure_refresher():
+    # one background refresher per process, started on first use so forked workers get their own
+    global _refresher_pid
+    if _refresher_pid == os.getpid():
+        return
+    with _lock:
+        if _refresher_pid == os.getpid():
+            return
+        _refresher_pid = os.getpid()
+    threading.Thread(target=refresh_loop, name="dirspec-map-refresh", daemon=True).start()
+
+def get_map_fig():
+    # snapshot on boot (or an empty map the first time ever), kept current by the refresher
+    global _fig, _signature
+    if _fig is None:
+        fig, signature = load_snapshot()
+        with _lock:
+            if _fig is None:
+                if fig is None:
+                    fig = build_map_fig(pd.DataFrame(columns=["n", "lat", "lon", "station_id", "name", "hm0", "p", "n_with_data"]))
+                _fig, _signature = fig, signature
+    ensure_refresher()
+    return _fig
@@ -1,12 +1,9 @@
 import plotly.graph_objects as go
-from scipy.ndimage import gaussian_filter1d
 
 def build_polar_plot(df,freq_bin):
-    # rolling smoothing of D
-    df["dir_smooth"] = gaussian_filter1d(df["spreading"], sigma=2)
-
-    # get the max value so that the plot can be sized
-    max_val = df['dir_smooth'].max()
+    # get the max value so that the plot can be sized, from D itself since
+    # MEM and MLM peaks are too narrow to survive smoothing
+    max_val = df['spreading'].max()
     radial_limit = max_val*1.1
 
     fig = go.Figure()
@@ -20,6 +17,13 @@ def build_polar_plot(df,freq_bin):
 
     fig.update_layout(
         title=f"Directional Spreading for f = {freq_bin:.3f} Hz",
+        **polar_layout(radial_limit)
+    )
+    return fig
+
+def polar_layout(radial_limit=None):
+    # axes and margins shared with the browser-side polar plot (assets/polar.js)
+    return dict(
         polar = dict(
             angularaxis= dict(
                 direction="clockwise", 
@@ -44,5 +48,4 @@ def build_polar_plot(df,freq_bin):
         ),
         showlegend = False,
         margin = {"l": 30, "r": 30, "t":40, "b": 30}
-    )
-    return fig
\ No newline at end of file
+    )
\ No newline at end of file
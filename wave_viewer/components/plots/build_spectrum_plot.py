@@ -3,7 +3,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 
-def build_spec_plot(df,selected_freq):
+def build_spec_plot(spectrum,selected_freq):
+    # spectrum maps frequency/energy_density/alpha1/alpha2/r1/r2 to equal length arrays
     fig = make_subplots(rows=3, cols=1, 
         shared_xaxes=True, 
         subplot_titles=("Spectral Energy Density", "Directional Mean (α₁, α₂)", "Directional Spread (r₁, r₂)"),
@@ -14,15 +15,15 @@ def build_spec_plot(df,selected_freq):
         height=300)
 
     # add energy density
-    fig.add_trace(go.Scatter(x=df["frequency"], y=df["energy_density"], mode='lines+markers', name='Ef', line=dict(color='royalblue')), row=1, col=1)
+    fig.add_trace(go.Scatter(x=spectrum["frequency"], y=spectrum["energy_density"], mode='lines+markers', name='Ef', line=dict(color='royalblue')), row=1, col=1)
 
     # 2. α₁, α₂ vs Frequency
-    fig.add_trace(go.Scatter(x=df["frequency"], y=df["alpha1"], mode='lines+markers', name='α₁', line=dict(color='orange')), row=2, col=1)
-    fig.add_trace(go.Scatter(x=df["frequency"], y=df["alpha2"], mode='lines+markers', name='α₂', line=dict(color='green')), row=2, col=1)
+    fig.add_trace(go.Scatter(x=spectrum["frequency"], y=spectrum["alpha1"], mode='lines+markers', name='α₁', line=dict(color='orange')), row=2, col=1)
+    fig.add_trace(go.Scatter(x=spectrum["frequency"], y=spectrum["alpha2"], mode='lines+markers', name='α₂', line=dict(color='green')), row=2, col=1)
 
     # 3. r₁, r₂ vs Frequency
-    fig.add_trace(go.Scatter(x=df["frequency"], y=df["r1"], mode='lines+markers', name='r₁', line=dict(color='red')), row=3, col=1)
-    fig.add_trace(go.Scatter(x=df["frequency"], y=df["r2"], mode='lines+markers', name='r₂', line=dict(color='purple')), row=3, col=1)
+    fig.add_trace(go.Scatter(x=spectrum["frequency"], y=spectrum["r1"], mode='lines+markers', name='r₁', line=dict(color='red')), row=3, col=1)
+    fig.add_trace(go.Scatter(x=spectrum["frequency"], y=spectrum["r2"], mode='lines+markers', name='r₂', line=dict(color='purple')), row=3, col=1)
 
     # Axis labels
     fig.update_xaxes(title_text="Frequency (Hz)", row=3, col=1)
@@ -31,15 +32,19 @@ def build_spec_plot(df,selected_freq):
     fig.update_yaxes(title_text="r values", row=3, col=1, automargin=False)
 
     if selected_freq:
-        fig.add_shape(
-            type="line",
-            x0=selected_freq,
-            x1=selected_freq,
-            y0=0,
-            y1=1,
-            line=dict(color="red", dash="dash"),
-            xref="x",
-            yref="paper",
-            layer="above"
-                )
-    return fig
\ No newline at end of file
+        fig.add_shape(**marker_shape(selected_freq))
+    return fig
+
+def marker_shape(selected_freq):
+    # red dashed line at the selected frequency, also sent alone as a Patch on frequency clicks
+    return dict(
+        type="line",
+        x0=selected_freq,
+        x1=selected_freq,
+        y0=0,
+        y1=1,
+        line=dict(color="red", dash="dash"),
+        xref="x",
+        yref="paper",
+        layer="above"
+    )
\ No newline at end of file
@@ -1,24 +1,36 @@
 from dash import dcc, html, Output, Input, State
 
-def build_sidebar(df_ts_param,station_id,station_name):
+def build_sidebar(params,station,stats=None):
+    # params is the timestep's time_steps columns, station the buoy's metadata,
+    # stats its spectral_stats row if it has one (plain dicts)
     sidebar_data = {
-        "Wind Direction (Degrees)": df_ts_param.loc[0,"wdir"],
-        "Wind Speed (m/s)": df_ts_param.loc[0,"wspd"],
-        "Max Gust (m/s)": df_ts_param.loc[0,'gst'],
-        "Signigicant Wave Height (m)": df_ts_param.loc[0,'wvht'],
-        "Dominant Wave Period (sec)": df_ts_param.loc[0,'dpd'],
-        "Average Wave Period (sec)": df_ts_param.loc[0,'apd'],
-        "Calculated Significant Wave Height (m)": f"{df_ts_param.loc[0,'hm0']:.2f}",
-        "Calculated Wave Energy Period (s)": f"{df_ts_param.loc[0,'te']:.2f}",
-        "Calculated Wave Potential Power (kW/m)": f"{df_ts_param.loc[0,'p']:.2f}",
+        "Wind Direction (Degrees)": params["wdir"],
+        "Wind Speed (m/s)": params["wspd"],
+        "Max Gust (m/s)": params['gst'],
+        "Signigicant Wave Height (m)": params['wvht'],
+        "Dominant Wave Period (sec)": params['dpd'],
+        "Average Wave Period (sec)": params['apd'],
+        "Calculated Significant Wave Height (m)": params['hm0'],
+        "Calculated Wave Energy Period (s)": params['te'],
+        "Calculated Wave Potential Power (kW/m)": params['p'],
     }
+    if stats is not None:
+        sidebar_data.update({
+            "Peak Period (s)": stats['tp'],
+            "Zero-Crossing Period Tm02 (s)": stats['tm02'],
+            "Peak Direction (Degrees)": stats['peak_dir'],
+            "Mean Direction (Degrees)": stats['mean_dir'],
+            "Directional Spread (Degrees)": stats['mean_spread'],
+            "Swell Hm0 (m)": stats['hm0_swell'],
+            "Wind Sea Hm0 (m)": stats['hm0_windsea'],
+        })
 
     info_items = []
     for label, value in sidebar_data.items():
         val_str = "-" if value is None else f"{value:.2f}" if isinstance(value, (float, int)) else str(value)
         info_items.append(html.P(f"{label}: {val_str}"))
         sidebar_built = html.Div([
-        html.H4(f"Station {station_id}: {station_name.iloc[0,0]}"), 
+        html.H4(f"Station {station['station_id']}: {station['name']}"), 
         *info_items
         ])
     return sidebar_built
\ No newline at end of file
@@ -0,0 +1,271 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import select
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# channel the ingester notifies on once spectra for a batch of timesteps are committed
+INGEST_CHANNEL = "dirspec_ingest"
+
+# entries held in memory across all cached queries
+MAX_ENTRIES = int(os.environ.get("DIRSPEC_CACHE_ENTRIES", 2048))
+
+# optional tier shared by every worker on the host, off unless a directory is given
+DISK_DIR = os.environ.get("DIRSPEC_CACHE_DIR")
+
+# size the disk tier is pruned back to, oldest files (by mtime) go first
+DISK_MAX_BYTES = int(float(os.environ.get("DIRSPEC_CACHE_DISK_MB", 512)) * 1e6)
+
+# seconds between listener wakeups when no notifications arrive
+LISTEN_TIMEOUT = 5
+
+_memory = OrderedDict()       # (name, args) -> (value, expires_at)
+_lock = threading.Lock()
+_counters = {}                # name -> {"hits", "disk_hits", "misses"}
+_kinds = {}                   # name -> "timestep" / "station"
+_engine_getter = None
+_listener_pid = None
+_disk_written = None          # bytes this process wrote since it last pruned, None before the first prune
+
+
+def set_engine_getter(getter):
+    # the listener borrows a connection from the query layer's engine
+    global _engine_getter
+    _engine_getter = getter
+
+
+def cacheable(value):
+    # empty results mean "not ingested yet" and must not stick
+    if value is None:
+        return False
+    if isinstance(value, pd.DataFrame):
+        return not value.empty
+    if isinstance(value, (list, tuple)):
+        return len(value) > 0
+    return True
+
+
+def fresh_copy(value):
+    # callers add columns to frames they get back, keep that off the cached object
+    return value.copy() if isinstance(value, pd.DataFrame) else value
+
+
+def disk_path(name, args):
+    # <dir>/<name>/<first arg>/<hash of all args>.pkl so one id can be dropped with one rmtree
+    digest = hashlib.sha1(repr(args).encode()).hexdigest()
+    return os.path.join(DISK_DIR, name, str(args[0]), f"{digest}.pkl")
+
+
+def disk_get(name, args, ttl):
+    path = disk_path(name, args)
+    try:
+        if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def disk_put(name, args, value):
+    global _disk_written
+    path = disk_path(name, args)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename so other workers never read half a file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp)
+        os.replace(tmp, path)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        # a value that can't be pickled just stays out of the disk tier
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+    # walking the directory on every write would cost more than the query, so each process
+    # prunes once at start and then after writing a tenth of the cap
+    with _lock:
+        due = _disk_written is None or _disk_written + size > DISK_MAX_BYTES // 10
+        _disk_written = 0 if due else _disk_written + size
+    if due:
+        prune_disk()
+
+
+def prune_disk(max_bytes=None):
+    # deletes the oldest entries until the disk tier is under max_bytes (DISK_MAX_BYTES)
+    max_bytes = DISK_MAX_BYTES if max_bytes is None else max_bytes
+    files = []
+    for root, _, names in os.walk(DISK_DIR):
+        for file_name in names:
+            path = os.path.join(root, file_name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(f[1] for f in files)
+    if total <= max_bytes:
+        return
+    files.sort()
+    # down to 90% so the next few writes don't prune again straight away
+    target = max_bytes * 0.9
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            # another worker got there first, or the id directory still has other entries
+            pass
+        total -= size
+
+
+def cached(name, kind="timestep", ttl=None, disk=True):
+    # memoizes a query on its arguments. kind says what the first argument is (a time_step id
+    # or a station id) so ingest notifications can drop the right entries, any other kind is only
+    # dropped by ttl or a full invalidation. ttl in seconds, None keeps entries until they are
+    # evicted or invalidated
+    _kinds[name] = kind
+    _counters[name] = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        n_params = len(signature.parameters)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ensure_listener()
+            # keyword and defaulted arguments are bound to the same positional key as a full
+            # positional call, so f(s) and f(s, None) share one entry. the common full positional
+            # call skips the binding
+            if kwargs or len(args) != n_params:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                args = bound.args
+            key = (name, args)
+            now = time.time()
+            with _lock:
+                entry = _memory.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    _memory.move_to_end(key)
+                    _counters[name]["hits"] += 1
+                    return fresh_copy(entry[0])
+
+            value = disk_get(name, args, ttl) if disk and DISK_DIR else None
+            if value is not None:
+                with _lock:
+                    _counters[name]["disk_hits"] += 1
+            else:
+                with _lock:
+                    _counters[name]["misses"] += 1
+                value = func(*args)
+                if not cacheable(value):
+                    return value
+                if disk and DISK_DIR:
+                    disk_put(name, args, value)
+
+            with _lock:
+                _memory[key] = (value, None if ttl is None else now + ttl)
+                _memory.move_to_end(key)
+                while len(_memory) > MAX_ENTRIES:
+                    _memory.popitem(last=False)
+            return fresh_copy(value)
+        return wrapper
+    return decorator
+
+
+def invalidate(timestep_ids=None, station_ids=None, disk=True):
+    # drops entries for the given ids from both tiers, everything if no ids are given.
+    # disk=False leaves the shared disk tier alone and only clears this process's memory
+    if timestep_ids is None and station_ids is None:
+        with _lock:
+            _memory.clear()
+        if disk and DISK_DIR:
+            for name in _kinds:
+                shutil.rmtree(os.path.join(DISK_DIR, name), ignore_errors=True)
+        return
+
+    targets = {"timestep": {str(i) for i in timestep_ids or []},
+               "station": {str(s) for s in station_ids or []}}
+    with _lock:
+        for key in [k for k in _memory if str(k[1][0]) in targets.get(_kinds[k[0]], ())]:
+            del _memory[key]
+    if DISK_DIR:
+        for name, kind in _kinds.items():
+            for target in targets.get(kind, ()):
+                shutil.rmtree(os.path.join(DISK_DIR, name, target), ignore_errors=True)
+
+
+def cache_stats():
+    # {name: {"hits", "disk_hits", "misses"}} plus the number of entries held in memory
+    with _lock:
+        stats = {name: dict(c) for name, c in _counters.items()}
+        stats["entries"] = len(_memory)
+    return stats
+
+
+def handle_notification(payload):
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        invalidate()
+        return
+    invalidate(message.get("time_step_ids") or [], message.get("station_ids") or [])
+
+
+def listen(engine):
+    # LISTEN on its own connection, detached from the pool so it never holds a pool slot
+    while True:
+        fairy = dbapi_conn = None
+        try:
+            fairy = engine.raw_connection()
+            fairy.detach()
+            dbapi_conn = fairy.dbapi_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cur:
+                cur.execute(f"LISTEN {INGEST_CHANNEL}")
+            while True:
+                if select.select([dbapi_conn], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    handle_notification(dbapi_conn.notifies.pop(0).payload)
+        except Exception as e:
+            # anything could have been ingested while disconnected. only this process's memory is
+            # dropped, every worker reconnects on its own and the disk tier is shared by all of them
+            print(f"Cache listener reconnecting: {e}")
+            invalidate(disk=False)
+        finally:
+            # the pool doesn't clean up a detached connection, left open it would hold a backend
+            try:
+                if dbapi_conn is not None:
+                    dbapi_conn.close()
+                elif fairy is not None:
+                    fairy.close()
+            except Exception:
+                pass
+        time.sleep(LISTEN_TIMEOUT)
+
+
+def ensure_listener():
+    # one listener thread per process, started on first use so forked workers get their own
+    global _listener_pid
+    if _listener_pid == os.getpid() or _engine_getter is None:
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    threading.Thread(target=listen, args=(_engine_getter(),), name="dirspec-cache-listener", daemon=True).start()
@@ -0,0 +1,79 @@
+import sys
+from sqlalchemy import text
+
+import data.query as dq
+
+# tables that grow with every ingest (and buoys, which holds the whole station catalog),
+# a sequential scan over any of them is a regression
+LARGE_TABLES = {"buoys", "time_steps", "spectral_stats", "spectra_parameters", "spectra_directional", "spectra_directional_packed"}
+
+# the viewer's queries and which sample parameter each one takes
+VIEWER_QUERIES = {
+    "buoy_locations": (dq.BUOY_LOCATIONS_SQL, {}),
+    "station_timesteps": (dq.STATION_TIMESTEPS_SQL, {"station_id": "station_id"}),
+    "timestep_page": (dq.TIMESTEP_PAGE_SQL, {"station_id": "station_id", "before": "before", "limit": "limit"}),
+    "timestep_page_after": (dq.TIMESTEP_PAGE_AFTER_SQL, {"station_id": "station_id", "after": "after", "limit": "limit"}),
+    "station_range": (dq.STATION_RANGE_SQL, {"station_id": "station_id"}),
+    "station_clusters": (dq.STATION_CLUSTERS_SQL, {key: key for key in ("west", "south", "east", "north", "west2", "east2", "cell")}),
+    "timestep_bundle": (dq.TIMESTEP_BUNDLE_SQL, {"ts": "timestep_id"}),
+    "spectrum": (dq.SPECTRUM_SQL, {"timestep_id": "timestep_id"}),
+    "packed_spreading": (dq.PACKED_SPREADING_SQL, {"ts": "timestep_id"}),
+    "directional_rows": (dq.DIRECTIONAL_ROWS_SQL, {"ts": "timestep_id"}),
+}
+
+
+def scans(plan):
+    # (node type, relation) for every scan node in an EXPLAIN (FORMAT JSON) plan tree
+    found = []
+    if "Relation Name" in plan:
+        found.append((plan["Node Type"], plan["Relation Name"]))
+    for child in plan.get("Plans", []):
+        found.extend(scans(child))
+    return found
+
+
+def sample_params(conn):
+    row = conn.execute(text("""
+        SELECT ts.id, b.station_id
+        FROM dirspec.time_steps ts
+        JOIN dirspec.buoys b ON b.id = ts.buoy_id
+        WHERE ts.spectra_ingested
+        ORDER BY ts.id DESC
+        LIMIT 1
+    """)).fetchone()
+    samples = {"timestep_id": 0, "station_id": "", "before": None, "after": "-infinity", "limit": dq.PAGE_SIZE,
+               # a zoom 7 view off California
+               "west": -125.0, "south": 33.0, "east": -117.0, "north": 40.0, "west2": -125.0, "east2": -117.0, "cell": 0.44}
+    if row is not None:
+        samples.update(timestep_id=row[0], station_id=row[1])
+    return samples
+
+
+def check_plans():
+    # plans every viewer query with sequential scans priced out, so on a small database it shows
+    # whether an index path exists at all rather than what the planner happens to prefer.
+    # returns {name: [(node type, relation), ...]} and the names that still scan a large table
+    results = {}
+    failures = []
+    with dq.get_engine().connect() as conn:
+        samples = sample_params(conn)
+        for name, (sql, param_map) in VIEWER_QUERIES.items():
+            params = {key: samples[sample] for key, sample in param_map.items()}
+            # SET LOCAL only lasts until the rollback
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+            conn.rollback()
+            results[name] = scans(plan[0]["Plan"])
+            if any(node == "Seq Scan" and rel in LARGE_TABLES for node, rel in results[name]):
+                failures.append(name)
+    return results, failures
+
+
+if __name__ == "__main__":
+    results, failures = check_plans()
+    for name, found in results.items():
+        status = "FAIL" if name in failures else "ok"
+        print(f"{status:4} {name}: " + ", ".join(f"{node} on {rel}" for node, rel in found))
+    if failures:
+        print(f"Sequential scans on large tables in: {', '.join(failures)}")
+        sys.exit(1)
@@ -0,0 +1,380 @@
+import atexit
+import bisect
+import contextvars
+import functools
+import glob
+import inspect
+import os
+import pickle
+import sys
+import threading
+import time
+import uuid
+
+from flask import Response, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import data.query as dq
+from data.cache import cache_stats
+from data.prefetch import prefetch_stats
+
+# set DIRSPEC_METRICS=0 to leave the app uninstrumented
+ENABLED = os.environ.get("DIRSPEC_METRICS", "1") != "0"
+
+# where the Prometheus text is served on the Flask server
+METRICS_PATH = os.environ.get("DIRSPEC_METRICS_PATH", "/metrics")
+
+# directory shared by every worker on the host. each process writes its counts there and a scrape
+# of any worker adds them all up, otherwise /metrics only covers the worker that answered it.
+# empty it before the server starts, like prometheus_client's multiprocess mode
+METRICS_DIR = os.environ.get("DIRSPEC_METRICS_DIR")
+
+# seconds between writes of this process's counts to METRICS_DIR
+FLUSH_SECONDS = 5
+
+# histogram bucket upper bounds, seconds and bytes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+# figure and component builders timed wherever they were imported
+FIGURE_BUILDERS = ["build_spec_plot", "build_polar_plot", "build_map_fig", "map_patch", "build_sidebar"]
+
+# packages whose modules get their query and builder references swapped for timed ones
+APP_PACKAGES = ("data", "callbacks", "components", "dirspec_layout", "dirspec")
+
+# name -> (type, label, buckets, help)
+METRICS = {
+    "dirspec_callback_seconds": ("histogram", "callback", LATENCY_BUCKETS,
+                                 "Time inside each Dash callback function"),
+    "dirspec_callback_errors_total": ("counter", "callback", None,
+                                      "Exceptions raised by each Dash callback function"),
+    "dirspec_request_seconds": ("histogram", "callback", LATENCY_BUCKETS,
+                                "Whole /_dash-update-component request, the part not in "
+                                "dirspec_callback_seconds is request parsing and response serialization"),
+    "dirspec_response_bytes": ("histogram", "callback", BYTES_BUCKETS,
+                               "Size of each callback response"),
+    "dirspec_query_seconds": ("histogram", "query", LATENCY_BUCKETS,
+                              "Each data.query function, cache hits included"),
+    "dirspec_db_seconds": ("histogram", "query", LATENCY_BUCKETS,
+                           "SQL statement execution, labeled with the query function that ran it"),
+    "dirspec_db_rows_total": ("counter", "query", None,
+                              "Rows returned by SQL statements, labeled with the query function that ran them"),
+    "dirspec_figure_seconds": ("histogram", "builder", LATENCY_BUCKETS,
+                               "Figure and component construction"),
+}
+
+_histograms = {}              # (metric, label value) -> [count per bucket..., count above, sum]
+_counters = {}                # (metric, label value) -> value
+_lock = threading.Lock()
+_instrumented = set()         # ids of apps already instrumented
+_flusher_pid = None
+_flush_path = None            # this process's file in METRICS_DIR
+
+# query function on the current thread, so SQL timings can be attributed to it
+_current_query = contextvars.ContextVar("dirspec_current_query", default="other")
+
+
+def observe(metric, label, value):
+    ensure_flusher()
+    buckets = METRICS[metric][2]
+    i = bisect.bisect_left(buckets, value)
+    with _lock:
+        h = _histograms.get((metric, label))
+        if h is None:
+            h = _histograms[(metric, label)] = [0] * (len(buckets) + 1) + [0.0]
+        h[i] += 1
+        h[-1] += value
+
+
+def increment(metric, label, value=1):
+    ensure_flusher()
+    with _lock:
+        _counters[(metric, label)] = _counters.get((metric, label), 0) + value
+
+
+def timed(metric, label, func):
+    # func with its wall time observed under metric{label}. exceptions are counted for callbacks
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if metric == "dirspec_callback_seconds":
+                increment("dirspec_callback_errors_total", label)
+            raise
+        finally:
+            observe(metric, label, time.perf_counter() - start)
+    wrapper.metrics_timed = True
+    return wrapper
+
+
+def timed_query(name, func):
+    # like timed, and marks the thread so the SQL it runs is labeled with name
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_query.set(name)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe("dirspec_query_seconds", name, time.perf_counter() - start)
+            _current_query.reset(token)
+    wrapper.metrics_timed = True
+    return wrapper
+
+
+def replace_everywhere(original, replacement):
+    # module-level functions are looked up at call time, so swapping every reference in the app's
+    # modules (from-imports included) routes all callers through the replacement
+    for module_name, module in list(sys.modules.items()):
+        if module is None or module_name.split(".")[0] not in APP_PACKAGES:
+            continue
+        for attr, value in list(vars(module).items()):
+            if value is original:
+                setattr(module, attr, replacement)
+
+
+def instrument_queries():
+    for name in [n for n in dir(dq) if n.startswith("get_") and n != "get_engine"]:
+        func = getattr(dq, name)
+        if callable(func) and not getattr(func, "metrics_timed", False):
+            replace_everywhere(func, timed_query(name, func))
+
+
+def instrument_builders():
+    for module in list(sys.modules.values()):
+        if module is None or module.__name__.split(".")[0] not in APP_PACKAGES:
+            continue
+        for name in FIGURE_BUILDERS:
+            func = vars(module).get(name)
+            # packages have submodules of the same name, only the function itself counts
+            if (inspect.isfunction(func) and func.__module__ == module.__name__
+                    and not getattr(func, "metrics_timed", False)):
+                replace_everywhere(func, timed("dirspec_figure_seconds", name, func))
+
+
+def before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+def after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_start")
+    if not starts:
+        return
+    name = _current_query.get()
+    observe("dirspec_db_seconds", name, time.perf_counter() - starts.pop())
+    if cursor.rowcount and cursor.rowcount > 0:
+        increment("dirspec_db_rows_total", name, cursor.rowcount)
+
+
+def instrument_callbacks(app):
+    # wraps every function later registered with @app.callback, so this runs before register_callbacks
+    register = app.callback
+
+    @functools.wraps(register)
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap(func):
+            return decorator(timed("dirspec_callback_seconds", func.__name__, func))
+        return wrap
+    app.callback = callback
+
+
+def callback_name(app, output):
+    entry = app.callback_map.get(output) if output else None
+    return entry["callback"].__name__ if entry and "callback" in entry else "unknown"
+
+
+def instrument_requests(app):
+    server = app.server
+
+    @server.before_request
+    def start_timer():
+        if request.path.endswith("_dash-update-component"):
+            g.metrics_start = time.perf_counter()
+            # Dash parses the same body for the callback, Flask keeps the parsed JSON so this is free
+            body = request.get_json(silent=True) or {}
+            g.metrics_output = body.get("output")
+
+    @server.after_request
+    def stop_timer(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            name = callback_name(app, g.pop("metrics_output", None))
+            observe("dirspec_request_seconds", name, time.perf_counter() - start)
+            # only when the size is already known, measuring it would mean buffering the response
+            if response.content_length is not None:
+                observe("dirspec_response_bytes", name, response.content_length)
+        return response
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def snapshot():
+    # everything this process reports, in the form written to METRICS_DIR
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    caches = cache_stats()
+    entries = caches.pop("entries")
+    gauges = {"dirspec_cache_entries": ("Entries held in the in-memory query cache", entries)}
+    for key, value in dq.pool_stats().items():
+        gauges[f"dirspec_pool_{key.removeprefix('pool_')}"] = (f"Connection pool {key.replace('_', ' ')}", value)
+    for key, value in prefetch_stats().items():
+        gauges[f"dirspec_prefetch_{key}"] = (f"Playback frames {key}", value)
+    return {"pid": os.getpid(), "histograms": histograms, "counters": counters, "caches": caches, "gauges": gauges}
+
+
+def flush():
+    # write then rename so a scrape never reads half a file. a forked child that hasn't recorded
+    # anything yet still holds its parent's path, so it writes nothing
+    if _flush_path is None or _flusher_pid != os.getpid():
+        return
+    tmp = f"{_flush_path}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump(snapshot(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, _flush_path)
+    except OSError as e:
+        print(f"Could not write metrics to {METRICS_DIR}: {e}")
+
+
+def flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        flush()
+
+
+def ensure_flusher():
+    # one flush thread per process once METRICS_DIR is set, started on first use so forked workers
+    # get their own file
+    global _flusher_pid, _flush_path
+    if METRICS_DIR is None or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        if _flusher_pid is not None:
+            # forked from a process that already recorded, those counts are in the parent's file
+            _histograms.clear()
+            _counters.clear()
+        _flusher_pid = os.getpid()
+        # a random suffix so a reused pid never overwrites a finished worker's counts
+        _flush_path = os.path.join(METRICS_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.pkl")
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    threading.Thread(target=flush_loop, name="dirspec-metrics-flush", daemon=True).start()
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def load_snapshots():
+    # this process's counts as they are now plus the last flush of every other worker
+    if METRICS_DIR is None:
+        return [snapshot()]
+    ensure_flusher()
+    flush()
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.pkl")):
+        try:
+            with open(path, "rb") as f:
+                snapshots.append(pickle.load(f))
+        except (OSError, pickle.UnpicklingError, EOFError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    # counters and histograms add up across workers, workers that have exited included so totals
+    # never go down. gauges are only kept for live workers, labeled by pid when there are several
+    histograms, counters, caches, gauges = {}, {}, {}, {}
+    for snap in snapshots:
+        for key, h in snap["histograms"].items():
+            total = histograms.setdefault(key, [0] * len(h))
+            for i, value in enumerate(h):
+                total[i] += value
+        for key, value in snap["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+        for name, counts in snap["caches"].items():
+            for result, count in counts.items():
+                caches.setdefault(name, {})
+                caches[name][result] = caches[name].get(result, 0) + count
+        if snap["pid"] == os.getpid() or alive(snap["pid"]):
+            for metric, (help_text, value) in snap["gauges"].items():
+                gauges.setdefault(metric, (help_text, {}))[1][snap["pid"]] = value
+    return histograms, counters, caches, gauges
+
+
+def render():
+    # Prometheus text exposition (version 0.0.4), built only when scraped
+    histograms, counters, caches, gauges = merge(load_snapshots())
+
+    lines = []
+    for metric, (kind, label, buckets, help_text) in METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        if kind == "histogram":
+            for (m, value), h in sorted(histograms.items()):
+                if m != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], h[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else repr(float(bound))
+                    lines.append(f'{metric}_bucket{{{label}="{escape(value)}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}="{escape(value)}"}} {h[-1]:.6f}')
+                lines.append(f'{metric}_count{{{label}="{escape(value)}"}} {cumulative}')
+        else:
+            for (m, value), count in sorted(counters.items()):
+                if m == metric:
+                    lines.append(f'{metric}{{{label}="{escape(value)}"}} {count}')
+
+    # what the cache, pool and prefetcher already count, read at scrape time
+    lines += ["# HELP dirspec_cache_requests_total Query cache lookups by outcome",
+              "# TYPE dirspec_cache_requests_total counter"]
+    for name, counts in sorted(caches.items()):
+        for result, count in counts.items():
+            lines.append(f'dirspec_cache_requests_total{{cache="{escape(name)}",result="{result}"}} {count}')
+    for metric, (help_text, values) in gauges.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        if METRICS_DIR is None:
+            lines += [f"{metric} {value}" for value in values.values()]
+        else:
+            lines += [f'{metric}{{worker="{pid}"}} {value}' for pid, value in sorted(values.items())]
+    return "\n".join(lines) + "\n"
+
+
+def instrument(app):
+    # timing for every callback, query function, figure builder and callback request, served at
+    # METRICS_PATH. recording is a couple of clock reads and a dict update per call, the text is
+    # only put together when something scrapes it
+    if not ENABLED or id(app) in _instrumented:
+        return
+    _instrumented.add(id(app))
+    instrument_callbacks(app)
+    instrument_queries()
+    instrument_builders()
+    instrument_requests(app)
+    # every engine, including one the query layer builds later
+    if not event.contains(Engine, "before_cursor_execute", before_execute):
+        event.listen(Engine, "before_cursor_execute", before_execute)
+        event.listen(Engine, "after_cursor_execute", after_execute)
+
+    # the last counts of a worker that shuts down cleanly still make it into the totals
+    atexit.register(flush)
+
+    @app.server.route(METRICS_PATH)
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
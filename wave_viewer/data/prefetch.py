@@ -0,0 +1,94 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from data import cache
+
+# threads rendering frames ahead of playback, each holds at most one pooled connection at a time
+PREFETCH_WORKERS = int(os.environ.get("DIRSPEC_PREFETCH_WORKERS", 4))
+
+# frames kept waiting to be shown, oldest dropped first
+MAX_FRAMES = 64
+
+# seconds a frame left in the shared disk tier stays usable, playback asks for it within a few ticks
+FRAME_TTL = 120
+
+_frames = OrderedDict()       # key -> Future
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def get_pool():
+    # one pool per process, a forked worker starts its own
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="dirspec-prefetch")
+            _pool_pid = os.getpid()
+            _frames.clear()
+    return _pool
+
+
+def disk_args(key):
+    # keys are (kind, timestep_id, ...), filed under the timestep id in the disk tier
+    return (key[1],) + tuple(key)
+
+
+def render(key, func, *args):
+    # under several workers the next playback request usually lands on another process, so with
+    # the shared disk tier (DIRSPEC_CACHE_DIR) the frame is also left there for whichever worker
+    # asks. without it prefetch only pays off with one worker or sticky sessions
+    value = func(*args)
+    if cache.DISK_DIR:
+        cache.disk_put("prefetch", disk_args(key), value)
+    return value
+
+
+def submit(key, func, *args):
+    # starts func(*args) in the background unless that frame is already queued or ready
+    pool = get_pool()
+    with _lock:
+        if key in _frames:
+            return
+        _frames[key] = pool.submit(render, key, func, *args)
+        while len(_frames) > MAX_FRAMES:
+            _frames.popitem(last=False)[1].cancel()
+
+
+def take_shared(key):
+    # a frame another worker prefetched into the disk tier, removed so it's handed out once
+    if not cache.DISK_DIR:
+        return None
+    value = cache.disk_get("prefetch", disk_args(key), FRAME_TTL)
+    if value is not None:
+        try:
+            os.remove(cache.disk_path("prefetch", disk_args(key)))
+        except OSError:
+            pass
+    return value
+
+
+def take(key, func, *args):
+    # the prefetched frame if there is one (waiting for it if it's still rendering), then one
+    # another worker left in the disk tier, otherwise func(*args) inline. frames are handed out
+    # once so nothing rendered here goes stale
+    with _lock:
+        future = _frames.pop(key, None)
+    if future is not None and not future.cancelled():
+        try:
+            value = future.result()
+            take_shared(key)
+            return value
+        except Exception as e:
+            print(f"Prefetched frame {key} failed, rendering inline: {e}")
+    value = take_shared(key)
+    if value is not None:
+        return value
+    return func(*args)
+
+
+def prefetch_stats():
+    with _lock:
+        return {"queued": len(_frames), "ready": sum(f.done() for f in _frames.values())}
@@ -1,94 +1,357 @@
+import os
+import threading
 from sqlalchemy import create_engine, text
+import numpy as np
 import pandas as pd
 
-CONN_STR = "postgresql+psycopg2://Jacob:@localhost:5432/postgres"
-engine = create_engine(CONN_STR)
-conn = engine.connect() 
+from data.cache import cached, set_engine_getter
+
+CONN_STR = os.environ.get("DIRSPEC_DB_URL", "postgresql+psycopg2://Jacob:@localhost:5432/postgres")
+
+# pool settings for the one engine shared by every callback thread in the process
+POOL_SETTINGS = {
+    "pool_size": int(os.environ.get("DIRSPEC_POOL_SIZE", 5)),          # connections kept open
+    "max_overflow": int(os.environ.get("DIRSPEC_POOL_OVERFLOW", 10)),  # extra connections under bursts
+    "pool_timeout": 30,        # seconds to wait for a free connection before erroring
+    "pool_recycle": 1800,      # reopen connections older than this (seconds)
+    "pool_pre_ping": True,     # check a connection is alive before handing it out
+}
+
+# element type of the spectra_directional_packed blocks (big-endian float4)
+PACKED_DTYPE = ">f4"
+
+# how far a clicked frequency may sit from a stored bin (packed bins are float4)
+FREQ_TOL = 1e-4
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+def configure_engine(**settings):
+    # replace the pool settings (e.g. from a server entry point), the engine is rebuilt on next use
+    global _engine
+    with _engine_lock:
+        POOL_SETTINGS.update(settings)
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+def get_engine():
+    # one pooled engine per process, created on first use. a forked worker must not reuse the
+    # parent's sockets, so a pid change drops the inherited pool without closing its connections
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        with _engine_lock:
+            if _engine is not None and _engine_pid != os.getpid():
+                _engine.dispose(close=False)
+                _engine = None
+            if _engine is None:
+                _engine = create_engine(CONN_STR, **POOL_SETTINGS)
+                _engine_pid = os.getpid()
+    return _engine
+
+def _reset_after_fork():
+    global _engine, _engine_lock
+    # the lock may have been held by another thread at fork time
+    _engine_lock = threading.Lock()
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+set_engine_getter(get_engine)
+
+def pool_stats():
+    # current pool usage, for logging or a status endpoint
+    if _engine is None or _engine_pid != os.getpid():
+        return {"pool_size": POOL_SETTINGS["pool_size"], "checked_in": 0, "checked_out": 0, "overflow": 0}
+    pool = _engine.pool
+    return {
+        "pool_size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        # sqlalchemy counts overflow from -pool_size, only connections beyond the pool are reported
+        "overflow": max(pool.overflow(), 0),
+    }
 
 # get buoy data for map plot
+# stations with spectra, from the summary the ingester keeps current instead of scanning every spectrum
+BUOY_LOCATIONS_SQL = """
+    SELECT b.station_id, b.name, b.lat, b.lon
+    FROM dirspec.buoys b
+    JOIN dirspec.station_availability a ON a.buoy_id = b.id
+    WHERE a.n_timesteps > 0
+"""
+
 def get_buoy_locations():
-    df = pd.read_sql("""
-        SELECT b.station_id, b.name, b.lat, b.lon
-        FROM dirspec.buoys b
-        JOIN dirspec.time_steps ts ON ts.buoy_id = b.id
-        JOIN dirspec.spectra_parameters sp ON sp.time_step_id = ts.id
-        GROUP BY b.station_id, b.name, b.lat, b.lon;
-    """, conn)
+    with get_engine().connect() as conn:
+        df = pd.read_sql(text(BUOY_LOCATIONS_SQL), conn)
     return df
 
+# every station in a lon/lat box (two boxes when it crosses the antimeridian), grouped into
+# grid cells of :cell degrees. a cell holding one station is that station, anything bigger is a
+# cluster drawn at its stations' mean position. stations dropped from the catalog only show while
+# they have history. the box test is a GiST search on buoys_location_idx
+STATION_CLUSTERS_SQL = """
+    SELECT count(*) AS n,
+           avg(b.lat) AS lat,
+           avg(b.lon) AS lon,
+           min(b.station_id) AS station_id,
+           min(b.name) AS name,
+           max(a.latest_hm0) AS hm0,
+           max(a.latest_p) AS p,
+           count(a.last_timestamp) AS n_with_data
+    FROM dirspec.buoys b
+    LEFT JOIN dirspec.station_availability a ON a.buoy_id = b.id
+    WHERE (point(b.lon, b.lat) <@ box(point(:west, :south), point(:east, :north))
+           OR point(b.lon, b.lat) <@ box(point(:west2, :south), point(:east2, :north)))
+      AND (b.active OR a.n_timesteps > 0)
+    GROUP BY floor(b.lon / :cell), floor(b.lat / :cell)
+"""
+
+@cached("station_clusters", kind="viewport", ttl=60, disk=False)
+def get_station_clusters(west, south, east, north, cell):
+    # one row per occupied cell: n, lat, lon, station_id/name (meaningful when n is 1), the highest
+    # latest hm0 and p in the cell, and how many of its stations have spectra
+    if west <= east:
+        boxes = {"west": west, "east": east, "west2": west, "east2": east}
+    else:
+        boxes = {"west": west, "east": 180.0, "west2": -180.0, "east2": east}
+    with get_engine().connect() as conn:
+        df = pd.read_sql(text(STATION_CLUSTERS_SQL), conn,
+                         params={**boxes, "south": south, "north": north, "cell": cell})
+    return df
+
+SPECTRUM_SQL = """
+    SELECT frequency, energy_density, alpha1, alpha2, r1, r2
+    FROM dirspec.spectra_parameters
+    WHERE time_step_id = :timestep_id
+    ORDER BY frequency
+"""
+
+@cached("spectrum")
 def get_spectrum_for_timestep(timestep_id):
-    df = pd.read_sql(text("""
-        SELECT frequency, energy_density, alpha1, alpha2, r1, r2
-        FROM dirspec.spectra_parameters
-        WHERE time_step_id = :timestep_id
-        ORDER BY frequency
-    """), conn, params={"timestep_id": timestep_id})
+    with get_engine().connect() as conn:
+        df = pd.read_sql(text(SPECTRUM_SQL), conn, params={"timestep_id": timestep_id})
     return df
 
+@cached("timestep_params")
 def get_param_for_timestep(timestep_id):
-    df_ts_param = pd.read_sql(text("""
-        SELECT wdir, wspd, gst, wvht, dpd, apd, mwd, pres, atmp, wtmp, dewp, vis, ptdy, tide, hm0, te, p
-        FROM dirspec.time_steps
-        WHERE id = :timestep_id
-    """), conn, params={"timestep_id": timestep_id})
+    with get_engine().connect() as conn:
+        df_ts_param = pd.read_sql(text("""
+            SELECT wdir, wspd, gst, wvht, dpd, apd, mwd, pres, atmp, wtmp, dewp, vis, ptdy, tide, hm0, te, p
+            FROM dirspec.time_steps
+            WHERE id = :timestep_id
+        """), conn, params={"timestep_id": timestep_id})
     return df_ts_param
 
+@cached("station_name", kind="station", ttl=3600)
 def get_station_name(station_id):
-    station_name = pd.read_sql(text("""
-        SELECT b.name
-        FROM dirspec.buoys b
-        WHERE b.station_id = :station_id
-    """), conn, params={"station_id": station_id})
+    with get_engine().connect() as conn:
+        station_name = pd.read_sql(text("""
+            SELECT b.name
+            FROM dirspec.buoys b
+            WHERE b.station_id = :station_id
+        """), conn, params={"station_id": station_id})
     return station_name
 
-def get_timestamp(timestep_id): 
-    timestamp = pd.read_sql(text(
-        "SELECT timestamp FROM dirspec.time_steps WHERE id = :id"),
-        conn,params={"id": timestep_id})["timestamp"].iloc[0]
+@cached("timestamp")
+def get_timestamp(timestep_id):
+    with get_engine().connect() as conn:
+        timestamp = pd.read_sql(text(
+            "SELECT timestamp FROM dirspec.time_steps WHERE id = :id"),
+            conn,params={"id": timestep_id})["timestamp"].iloc[0]
     return timestamp
 
+STATION_TIMESTEPS_SQL = """
+    SELECT ts.id, ts.timestamp
+    FROM dirspec.time_steps ts
+    JOIN dirspec.buoys b ON ts.buoy_id = b.id
+    WHERE b.station_id = :station_id
+    ORDER BY ts.timestamp DESC
+"""
+
+@cached("station_timesteps", kind="station", ttl=300)
 def get_ts_data(station_id):
-    with engine.connect() as conn:
-        results = conn.execute(
-            text("""
-            SELECT ts.id, ts.timestamp
-            FROM dirspec.time_steps ts
-            JOIN dirspec.buoys b ON ts.buoy_id = b.id
-            WHERE b.station_id = :station_id
-            ORDER BY ts.timestamp DESC
-            """), {"station_id": station_id}
-        ).fetchall()
-    return results
+    with get_engine().connect() as conn:
+        results = conn.execute(text(STATION_TIMESTEPS_SQL), {"station_id": station_id}).fetchall()
+    # plain tuples so the listing can go through the disk cache
+    return [tuple(row) for row in results]
 
 def get_timesteps_for_dd(station_id):
-    engine = create_engine(CONN_STR)
-    with engine.connect() as conn:
-        results = conn.execute(
-            text("""
-            SELECT ts.id, ts.timestamp
-            FROM dirspec.time_steps ts
-            JOIN dirspec.buoys b ON ts.buoy_id = b.id
-            WHERE b.station_id = :station_id
-            ORDER BY ts.timestamp DESC
-            """), {"station_id": station_id}
-        ).fetchall()
-    return results
+    # same listing as get_ts_data, kept for existing callers
+    return get_ts_data(station_id)
+
+# timesteps per dropdown page, about a week of hourly spectra
+PAGE_SIZE = 168
+
+# keyset page, newest first: only rows strictly older than :before, so each page costs one
+# index range scan of :limit rows however much history the station has
+TIMESTEP_PAGE_SQL = """
+    SELECT ts.id, ts.timestamp
+    FROM dirspec.time_steps ts
+    WHERE ts.buoy_id = (SELECT id FROM dirspec.buoys WHERE station_id = :station_id)
+      AND ts.spectra_ingested
+      AND ts.timestamp < COALESCE(CAST(:before AS TIMESTAMPTZ), 'infinity')
+    ORDER BY ts.timestamp DESC
+    LIMIT :limit
+"""
+
+@cached("timestep_page", kind="station", ttl=300)
+def get_timestep_page(station_id, before=None, limit=PAGE_SIZE):
+    # [(id, timestamp), ...] newest first, older than before (an ISO string, None for the latest).
+    # pass the last timestamp of a page as before to get the next older page
+    with get_engine().connect() as conn:
+        results = conn.execute(text(TIMESTEP_PAGE_SQL),
+                               {"station_id": station_id, "before": before, "limit": limit}).fetchall()
+    return [tuple(row) for row in results]
+
+# the same keyset walk the other way, oldest first from just after :after, for playback running
+# forward in time past the newest timestep the dropdown holds
+TIMESTEP_PAGE_AFTER_SQL = """
+    SELECT ts.id, ts.timestamp
+    FROM dirspec.time_steps ts
+    WHERE ts.buoy_id = (SELECT id FROM dirspec.buoys WHERE station_id = :station_id)
+      AND ts.spectra_ingested
+      AND ts.timestamp > CAST(:after AS TIMESTAMPTZ)
+    ORDER BY ts.timestamp
+    LIMIT :limit
+"""
+
+@cached("timestep_page_after", kind="station", ttl=300)
+def get_timestep_page_after(station_id, after, limit=PAGE_SIZE):
+    # [(id, timestamp), ...] oldest first, newer than after (an ISO string with its offset)
+    with get_engine().connect() as conn:
+        results = conn.execute(text(TIMESTEP_PAGE_AFTER_SQL),
+                               {"station_id": station_id, "after": after, "limit": limit}).fetchall()
+    return [tuple(row) for row in results]
+
+STATION_RANGE_SQL = """
+    SELECT a.first_timestamp, a.last_timestamp, a.n_timesteps
+    FROM dirspec.station_availability a
+    JOIN dirspec.buoys b ON b.id = a.buoy_id
+    WHERE b.station_id = :station_id
+"""
+
+@cached("station_range", kind="station", ttl=300)
+def get_station_range(station_id):
+    # (first timestamp, last timestamp, number of timesteps) with spectra, None if there are none
+    with get_engine().connect() as conn:
+        row = conn.execute(text(STATION_RANGE_SQL), {"station_id": station_id}).fetchone()
+    return tuple(row) if row is not None else None
+
+# time_steps columns shown in the sidebar
+PARAM_COLUMNS = ["wdir", "wspd", "gst", "wvht", "dpd", "apd", "mwd", "pres", "atmp", "wtmp",
+                 "dewp", "vis", "ptdy", "tide", "hm0", "te", "p"]
+
+# spectra_parameters columns returned as arrays, ordered by frequency
+SPECTRUM_COLUMNS = ["frequency", "energy_density", "alpha1", "alpha2", "r1", "r2"]
+
+# spectral_stats columns, computed at ingest so nothing here aggregates the frequency rows
+STATS_COLUMNS = ["tp", "tm01", "tm02", "peak_dir", "peak_spread", "mean_dir", "mean_spread",
+                 "hm0_swell", "hm0_windsea", "swell_fraction"]
+
+TIMESTEP_BUNDLE_SQL = f"""
+    SELECT
+        ts.timestamp, b.station_id, b.name, b.lat, b.lon,
+        {", ".join(f"ts.{c}" for c in PARAM_COLUMNS)},
+        st.time_step_id AS has_stats,
+        {", ".join(f"st.{c} AS stat_{c}" for c in STATS_COLUMNS)},
+        {", ".join(f"sp.{c}" for c in SPECTRUM_COLUMNS)}
+    FROM dirspec.time_steps ts
+    JOIN dirspec.buoys b ON b.id = ts.buoy_id
+    LEFT JOIN dirspec.spectral_stats st ON st.time_step_id = ts.id
+    CROSS JOIN LATERAL (
+        SELECT
+        {", ".join(f"array_agg({c} ORDER BY frequency) AS {c}" for c in SPECTRUM_COLUMNS)}
+        FROM dirspec.spectra_parameters
+        WHERE time_step_id = ts.id
+    ) sp
+    WHERE ts.id = :ts
+"""
+
+@cached("timestep_bundle")
+def get_timestep_bundle(timestep_id):
+    # everything the spectrum plot and sidebar need in one round-trip:
+    # {"timestep_id", "timestamp", "station": {...}, "params": {...}, "stats": {...} or None,
+    #  "spectrum": {column: np.ndarray}}. None if the timestep doesn't exist or has no spectrum yet
+    with get_engine().connect() as conn:
+        row = conn.execute(text(TIMESTEP_BUNDLE_SQL), {"ts": timestep_id}).fetchone()
+
+    if row is None or row[-1] is None:
+        return None
+    row = row._mapping
+    return {
+        "timestep_id": timestep_id,
+        "timestamp": row["timestamp"],
+        "station": {k: row[k] for k in ("station_id", "name", "lat", "lon")},
+        "params": {c: row[c] for c in PARAM_COLUMNS},
+        # timesteps ingested before spectral_stats existed have none until ingest/stats.py is run
+        "stats": {c: row[f"stat_{c}"] for c in STATS_COLUMNS} if row["has_stats"] is not None else None,
+        # NULLs come back as None, float arrays turn them into NaN
+        "spectrum": {c: np.array(row[c], dtype=float) for c in SPECTRUM_COLUMNS},
+    }
+
+def unpack(block):
+    return np.frombuffer(block, dtype=PACKED_DTYPE).astype(float)
+
+PACKED_SPREADING_SQL = """
+    SELECT frequencies, directions, energy_density, spreading
+    FROM dirspec.spectra_directional_packed
+    WHERE time_step_id = :ts
+"""
+
+# the join matches on the full (time_step_id, frequency) key, so both sides are primary key scans
+DIRECTIONAL_ROWS_SQL = """
+    SELECT 
+        d.frequency,
+        d.direction,
+        d.spreading,
+        p.energy_density
+    FROM dirspec.spectra_directional d
+    JOIN dirspec.spectra_parameters p
+        ON d.time_step_id = p.time_step_id
+        AND d.frequency = p.frequency
+    WHERE d.time_step_id = :ts
+    ORDER BY d.frequency, d.direction
+"""
+
+@cached("spreading_matrix")
+def get_spreading_matrix(timestep_id):
+    # (frequencies, directions, energy_density, D as F×Θ) for one timestep, None if it has no spectra
+    with get_engine().connect() as conn:
+        row = conn.execute(text(PACKED_SPREADING_SQL), {"ts": timestep_id}).fetchone()
+
+        if row is not None:
+            freqs = np.array(row[0], dtype=float)
+            directions = np.array(row[1], dtype=float)
+            D = unpack(row[3]).reshape(len(freqs), len(directions))
+            return freqs, directions, unpack(row[2]), D
+
+        # timesteps that haven't been packed yet are still one row per (frequency, direction)
+        df = pd.read_sql(text(DIRECTIONAL_ROWS_SQL), conn, params={"ts": timestep_id})
+
+    if df.empty:
+        return None
+    D = df.pivot(index="frequency", columns="direction", values="spreading")
+    energy = df.groupby("frequency")["energy_density"].first()
+    return D.index.to_numpy(dtype=float), D.columns.to_numpy(dtype=float), energy.to_numpy(dtype=float), D.to_numpy()
 
 def get_spectral_data(timestep_id, freq_bin):
-    engine = create_engine(CONN_STR)
-    with engine.connect() as conn:
-        df = pd.read_sql(
-            text("""
-            SELECT 
-                d.direction,
-                d.spreading,
-                p.energy_density
-            FROM dirspec.spectra_directional d
-            JOIN dirspec.spectra_parameters p
-                ON d.time_step_id = p.time_step_id
-                AND d.frequency = p.frequency
-            WHERE d.time_step_id = :ts
-            AND d.frequency = :f
-            ORDER BY d.direction             
-        """), conn, params={"ts": timestep_id, "f": freq_bin})
-        return df
\ No newline at end of file
+    # direction, spreading and energy_density at one frequency bin, empty if there is none
+    columns = ["direction", "spreading", "energy_density"]
+    matrix = get_spreading_matrix(timestep_id)
+    if matrix is None:
+        return pd.DataFrame(columns=columns)
+
+    freqs, directions, energy, D = matrix
+    i = int(np.abs(freqs - freq_bin).argmin())
+    if abs(freqs[i] - freq_bin) > FREQ_TOL:
+        return pd.DataFrame(columns=columns)
+
+    return pd.DataFrame({
+        "direction": directions,
+        "spreading": D[i],
+        "energy_density": energy[i],
+    })
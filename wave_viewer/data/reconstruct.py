@@ -0,0 +1,66 @@
+import importlib.util
+import os
+import numpy as np
+import pandas as pd
+
+import data.query as dq
+from data.cache import cached
+
+# the viewer rebuilds D(θ) with the ingester's own estimators, loaded by path so ingest/ doesn't
+# have to go on sys.path (its module names would shadow the viewer's)
+SPREADING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ingest", "spreading.py")
+_spec = importlib.util.spec_from_file_location("dirspec_spreading", SPREADING_PATH)
+spreading = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(spreading)
+
+# same 5 degree grid the ingester writes to the spreading tables
+DIRECTIONS = spreading.DIRECTIONS
+ESTIMATORS = sorted(spreading.ESTIMATORS)
+DEFAULT_ESTIMATOR = spreading.DEFAULT_ESTIMATOR
+
+# how far a clicked frequency may sit from a bin
+FREQ_TOL = 1e-4
+
+
+def spreading_matrix(alpha1, alpha2, r1, r2, estimator=DEFAULT_ESTIMATOR, directions=DIRECTIONS):
+    # normalized D as F×Θ from the F-long coefficient arrays, matches what the ingester stores
+    alpha1, alpha2, r1, r2 = (np.asarray(x, dtype=float)[None] for x in (alpha1, alpha2, r1, r2))
+    return spreading.spreading_chunk(alpha1, alpha2, r1, r2, directions, estimator)[0]
+
+
+# cheap to rebuild, so it stays out of the disk tier
+@cached("reconstruct", disk=False)
+def reconstruct_timestep(timestep_id, estimator=DEFAULT_ESTIMATOR):
+    # (frequencies, directions, energy_density, D as F×Θ) rebuilt from spectra_parameters,
+    # same shape as dq.get_spreading_matrix. None if the timestep has no spectrum.
+    # reads the same bundle as the spectrum plot, so a polar click costs no extra query
+    bundle = dq.get_timestep_bundle(timestep_id)
+    if bundle is None:
+        return None
+
+    spectrum = bundle["spectrum"]
+    D = spreading_matrix(spectrum["alpha1"], spectrum["alpha2"], spectrum["r1"], spectrum["r2"], estimator)
+    out = (spectrum["frequency"], DIRECTIONS.astype(float), spectrum["energy_density"], D)
+    # cached arrays are shared between callers
+    for a in out:
+        a.setflags(write=False)
+    return out
+
+
+def reconstruct_frequency(timestep_id, freq_bin, estimator=DEFAULT_ESTIMATOR):
+    # direction, spreading and energy_density at one frequency bin, same frame as dq.get_spectral_data
+    columns = ["direction", "spreading", "energy_density"]
+    matrix = reconstruct_timestep(timestep_id, estimator)
+    if matrix is None:
+        return pd.DataFrame(columns=columns)
+
+    freqs, directions, energy, D = matrix
+    i = int(np.abs(freqs - freq_bin).argmin())
+    if abs(freqs[i] - freq_bin) > FREQ_TOL:
+        return pd.DataFrame(columns=columns)
+
+    return pd.DataFrame({
+        "direction": directions,
+        "spreading": D[i],
+        "energy_density": energy[i],
+    })
@@ -1,12 +1,16 @@
 from dash import Dash 
 import dirspec_layout
 from callbacks import register_callbacks
+from data import metrics
 
 # initialize the app
 app = Dash((__name__), suppress_callback_exceptions=True)
 app.title = "Wave Spectral Dashboard"
 app.layout = dirspec_layout.layout
 
+# timing for callbacks, queries and figures, scraped from /metrics. has to wrap app.callback
+# before the callbacks are registered
+metrics.instrument(app)
 register_callbacks(app)
 
 if __name__ == "__main__":
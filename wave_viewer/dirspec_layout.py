@@ -3,70 +3,119 @@ from dash import dcc, html
 
 # components
 from components.empty_figs import empty_fig, empty_fig_spec
-from components.map.map_fig import fig
+from components.map.map_fig import get_map_fig
+from components.plots.build_polar_plot import polar_layout
+from data.reconstruct import FREQ_TOL, ESTIMATORS, DEFAULT_ESTIMATOR
+from callbacks.playback_callbacks import PLAYBACK_SPEEDS, DEFAULT_SPEED
 
-layout = html.Div(style={"height": "95vh", "display": "flex", "flexDirection": "column", "margin": "0px", "padding": "0px"}, children=[
+# built per page load so the map comes from the cache, not from an import-time query
+def layout():
+    return html.Div(style={"height": "95vh", "display": "flex", "flexDirection": "column", "margin": "0px", "padding": "0px"}, children=[
     
-    # Top: Map + sidebar section
-    html.Div(style={"flex": "2", "display": "flex"}, children=[
-        # Map
-        html.Div(style={"flex": "3", 
-                        "minHeight": "0px", 
-                        "minWidth": "0px", 
-                        "height": "100%", 
-                        "width": "100%", 
-                        "margin": "0", 
-                        "padding": "0"}, children=[
-            #html.H2("Wave Buoy Map", style={"margin": "10px"}),
-            dcc.Graph(id="buoy-map", figure=fig, style={"height": "100%", "width": "100%"}, config={"displayModeBar": False}),
-            dcc.Store(id="stored-buoy"),
-            dcc.Store(id="stored-timestep"),
-            dcc.Store(id="stored-freq")
-    ]),
+        # Top: Map + sidebar section
+        html.Div(style={"flex": "2", "display": "flex"}, children=[
+            # Map
+            html.Div(style={"flex": "3", 
+                            "minHeight": "0px", 
+                            "minWidth": "0px", 
+                            "height": "100%", 
+                            "width": "100%", 
+                            "margin": "0", 
+                            "padding": "0"}, children=[
+                #html.H2("Wave Buoy Map", style={"margin": "10px"}),
+                dcc.Graph(id="buoy-map", figure=get_map_fig(), style={"height": "100%", "width": "100%"}, config={"displayModeBar": False}),
+                # region and zoom level the map's stations were last fetched for
+                dcc.Store(id="map-region"),
+                dcc.Store(id="stored-buoy"),
+                dcc.Store(id="stored-timestep"),
+                dcc.Store(id="stored-freq"),
+                # timestamp the next "load older" page starts below, None when there is nothing older
+                dcc.Store(id="timestep-cursor"),
+                # F×Θ spreading matrix of the selected timestep, drawn browser-side on frequency clicks
+                dcc.Store(id="stored-spreading"),
+                # static pieces the browser-side polar plot needs, sent once with the page
+                dcc.Store(id="polar-template", data={
+                    "empty": empty_fig_spec.to_plotly_json(),
+                    "layout": polar_layout(),
+                    "freq_tol": FREQ_TOL,
+                })
+        ]),
 
-        # Sidebar
-        html.Div(id="station-sidebar", style={
+            # Sidebar
+            html.Div(id="station-sidebar", style={
+                "flex": "1",
+                "padding": "10px",
+                "borderLeft": "1px solid #ccc",
+                "backgroundColor": "#f9f9f9",
+                "overflowY": "auto",
+                "height": "100%",
+                "display": "flex",
+                "flexDirection": "column"
+            }, children=[
+                # top section for timestep selection
+                html.Div([
+                    html.Label("Select Timestep:"),
+                    dcc.Dropdown(
+                        id="timestep-dropdown", 
+                        placeholder="Choose a timestamp", 
+                        options=[],
+                        style={"width": "100%"},
+                        clearable=False
+                    ),
+                    # the dropdown only holds a page of timesteps, older ones are fetched on demand
+                    html.Div(style={"display": "flex", "gap": "10px", "marginTop": "5px", "alignItems": "center"}, children=[
+                        html.Button("Load older", id="load-older-timesteps", n_clicks=0, disabled=True),
+                        dcc.DatePickerSingle(
+                            id="timestep-jump",
+                            placeholder="Jump to date",
+                            display_format="YYYY-MM-DD",
+                            clearable=True
+                        )
+                    ]),
+                    # time-lapse through the timesteps in the dropdown
+                    html.Div(style={"display": "flex", "gap": "10px", "marginTop": "5px", "alignItems": "center"}, children=[
+                        html.Button("Play", id="playback-toggle", n_clicks=0),
+                        dcc.Dropdown(
+                            id="playback-speed",
+                            options=[{"label": f"{fps} fps", "value": fps} for fps in PLAYBACK_SPEEDS],
+                            value=DEFAULT_SPEED,
+                            clearable=False,
+                            style={"width": "100px"}
+                        ),
+                        html.Span(id="playback-fps"),
+                        # directional estimator the polar plot is rebuilt with
+                        dcc.Dropdown(
+                            id="estimator-select",
+                            options=[{"label": name.upper(), "value": name} for name in ESTIMATORS],
+                            value=DEFAULT_ESTIMATOR,
+                            clearable=False,
+                            style={"width": "120px"}
+                        ),
+                        dcc.Interval(id="playback-interval", interval=int(1000 / DEFAULT_SPEED), disabled=True),
+                        dcc.Store(id="playback-state")
+                    ])
+                ]),
+                # bottom for station stats
+                html.Div(id="station-stats", children=[
+                    #html.H4("Station Info"),
+                    html.Div(id="station-info", children="Click a buoy to view details.")
+                ])
+            ])
+        ]),
+
+        # Bottom: Docked spectral + polar plots
+        html.Div(style={
             "flex": "1",
-            "padding": "10px",
-            "borderLeft": "1px solid #ccc",
+            "borderTop": "1px solid #ccc",
             "backgroundColor": "#f9f9f9",
-            "overflowY": "auto",
+            "minHeight": "0",
             "height": "100%",
-            "display": "flex",
-            "flexDirection": "column"
-        }, children=[
-            # top section for timestep selection
-            html.Div([
-                html.Label("Select Timestep:"),
-                dcc.Dropdown(
-                    id="timestep-dropdown", 
-                    placeholder="Choose a timestamp", 
-                    options=[],
-                    style={"width": "100%"},
-                    clearable=False
-                )
-            ]),
-            # bottom for station stats
-            html.Div(id="station-stats", children=[
-                #html.H4("Station Info"),
-                html.Div(id="station-info", children="Click a buoy to view details.")
+            "margin": "0",
+            "padding": "0"
+        }, children=[       
+            html.Div(style={"display": "flex", "justifyContent": "space-between", "height": "100%"}, children=[
+                dcc.Graph(id="spectrum-plot", style={"flex": "3", "height": "100%"}, figure=empty_fig),
+                dcc.Graph(id="polar-plot", style={"flex": "1", "height": "100%", "borderLeft": "1px solid #ccc", "marginRight": "20px"}, figure=empty_fig_spec)
             ])
         ])
-    ]),
-
-    # Bottom: Docked spectral + polar plots
-    html.Div(style={
-        "flex": "1",
-        "borderTop": "1px solid #ccc",
-        "backgroundColor": "#f9f9f9",
-        "minHeight": "0",
-        "height": "100%",
-        "margin": "0",
-        "padding": "0"
-    }, children=[       
-        html.Div(style={"display": "flex", "justifyContent": "space-between", "height": "100%"}, children=[
-            dcc.Graph(id="spectrum-plot", style={"flex": "3", "height": "100%"}, figure=empty_fig),
-            dcc.Graph(id="polar-plot", style={"flex": "1", "height": "100%", "borderLeft": "1px solid #ccc", "marginRight": "20px"}, figure=empty_fig_spec)
-        ])
-    ])
-])
\ No newline at end of file
+    ])
\ No newline at end of file